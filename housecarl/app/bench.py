@@ -0,0 +1,365 @@
+import os
+import cv2
+import sys
+import json
+import argparse
+import resource
+import numpy as np
+from time import time
+
+from housecarl.library.common import utility, metrics
+from housecarl.library.common.constants import default_config_path
+
+MODELS = ['mobilenet', 'yolo', 'coral', 'onnx']
+IOU_THRESH = 0.5
+VIDEO_EXTENSIONS = ['.ogv', '.ogg', '.mp4', '.avi', '.mkv', '.webm']
+PERCENTILES = [50, 90, 99]
+
+def get_args(argv):
+    ap = argparse.ArgumentParser(prog='carl bench', description='Replay recorded video through the detection pipeline as fast as possible.')
+    ap.add_argument('path', nargs='?', default=None, help='A video file, or a directory of recordings.')
+    ap.add_argument('-c', '--config', help='Path to config.json. Only the video, detector and monitor groups are used.', default=None)
+    ap.add_argument('--models', nargs='+', default=MODELS, help='Models or model variants to benchmark. Accuracy is measured against the first one.')
+    ap.add_argument('--width', type=int, default=None, help='Video width. Defaults to config.video.width.')
+    ap.add_argument('--max-frames', type=int, default=0, help='Stop after this many frames per model.')
+    ap.add_argument('--json', default=None, help='Write the results to this path as json.')
+    ap.add_argument('--yolo-decode', action='store_true', help='Micro-benchmark YOLO post-processing on synthetic output layers instead.')
+    ap.add_argument('--coral-pipeline', action='store_true', help='Check the Coral pipeline on fake devices instead.')
+
+    return vars(ap.parse_args(argv))
+
+def get_video_paths(path):
+    if os.path.isfile(path):
+        return [path]
+
+    video_paths = []
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        video_paths += [os.path.join(root, f) for f in sorted(files) if os.path.splitext(f)[1].lower() in VIDEO_EXTENSIONS]
+
+    return video_paths
+
+def get_config(config_path):
+    """
+    Merge the user config groups over the defaults. Plain dicts stand in for CLI_Groups.
+    """
+    config = utility.read_json(default_config_path)
+    user_config = utility.read_json(config_path) if config_path else None
+
+    for group_name, group in (user_config or {}).items():
+        if group_name in config and utility.get_typename(group) == 'dict':
+            config[group_name].update(group)
+
+    return config
+
+class BenchGroup(dict):
+    """
+    A plain dict standing in for a CLI_Group.
+    """
+    def set(self, config_key, config_value):
+        self[config_key] = config_value
+
+def replay(video_paths, video_config, width, max_frames, handle_frame):
+    """
+    Pass every frame of the videos to handle_frame through Video and ThreadedVideoReader, as fast as handle_frame allows,
+    so capture, decode_every, resizing and the frame pool are measured as they run in carl.
+
+    Returns (num_frames, seconds), where seconds runs from starting each video until its last frame was handled.
+    """
+    # imported here so that loading the cli doesn't open a camera module
+    from housecarl.library.camera import Video
+
+    num_frames = 0
+    elapsed = 0
+
+    for video_path in video_paths:
+        started_at = time()
+        finished_at = started_at
+
+        def on_frame(frame, stop):
+            nonlocal num_frames, finished_at
+
+            handle_frame(frame)
+            num_frames += 1
+            finished_at = time()
+
+            if max_frames and num_frames >= max_frames:
+                stop()
+
+        config = BenchGroup(video_config, src=video_path, width=width, display=False, name='bench')
+        Video(config, on_frame=on_frame, name='bench', replay=True).start()
+        elapsed += finished_at - started_at
+
+        if max_frames and num_frames >= max_frames:
+            break
+
+    return (num_frames, elapsed)
+
+def get_peak_rss_mb():
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in bytes on mac and kilobytes everywhere else
+    return peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+def count_matches(reference, detections):
+    """
+    Greedily match detections to reference detections with the same label and an IoU of at least IOU_THRESH.
+    """
+    unmatched = list(reference)
+    num_matches = 0
+
+    for (label, box) in detections:
+        for i, (reference_label, reference_box) in enumerate(unmatched):
+            if label == reference_label and utility.get_iou(box, reference_box) >= IOU_THRESH:
+                num_matches += 1
+                del unmatched[i]
+                break
+
+    return num_matches
+
+def add_accuracy(result, reference):
+    """
+    There is no ground truth for recordings, so accuracy is the precision and recall against a reference model.
+    """
+    num_matches = sum(count_matches(r, d) for r, d in zip(reference['detections'], result['detections']))
+    num_reference = sum(len(r) for r in reference['detections'])
+    num_detections = sum(len(d) for d in result['detections'])
+
+    result['reference'] = reference['model']
+    result['precision'] = num_matches / num_detections if num_detections else None
+    result['recall'] = num_matches / num_reference if num_reference else None
+
+def run_model(variant, config, video_paths, width, max_frames):
+    # imported here so that loading the cli doesn't load every detector
+    from housecarl.library.monitor import Monitor
+    from housecarl.library.detectors import Detector, models
+
+    overrides = models.get_variant(variant, config['detector'].get('variants'))
+    detector_config = dict(config['detector'], **overrides)
+    detector_config.update(threaded=False, processes=0, show_detections=False)
+    monitor = Monitor(config=config['monitor'])
+
+    detector = Detector(detector_config)
+
+    # leave the first, slow inference out of the results
+    detector.warm_up(background=False)
+    metrics.reset()
+
+    frame_detections = []
+
+    def handle_detections(detections, frame):
+        frame_detections.append([(label, [int(v) for v in box]) for (label, confidence, box, color) in detections])
+        monitor.handle_detections(detections, frame)
+
+    # Video times each frame's processing as the process stage
+    (num_frames, elapsed) = replay(
+        video_paths,
+        config['video'],
+        width,
+        max_frames,
+        lambda frame: detector.process_frame(frame, on_detections=handle_detections)
+    )
+
+    stages = {}
+    for (stage, labels, histogram) in metrics.get_histograms():
+        stages[stage] = {'count': histogram.count, 'mean': histogram.sum / histogram.count if histogram.count else None}
+        stages[stage].update({'p{}'.format(q): histogram.percentile(q) for q in PERCENTILES})
+
+    return {
+        'model': variant,
+        'frames': num_frames,
+        'seconds': elapsed,
+        'fps': num_frames / elapsed if elapsed else 0,
+        'peak_rss_mb': get_peak_rss_mb(),
+        'stages': stages,
+        'detections': frame_detections
+    }
+
+def print_result(result):
+    if result.get('error'):
+        utility.error('{} failed: {}'.format(result['model'], result['error']))
+        return
+
+    utility.info('{}: {} frames in {:.2f}s, {:.2f} fps, peak RSS {:.0f} MB'.format(
+        result['model'], result['frames'], result['seconds'], result['fps'], result['peak_rss_mb']
+    ))
+
+    if result.get('reference') and result['reference'] != result['model']:
+        utility.info('{}: precision {} and recall {} against {}'.format(
+            result['model'],
+            'n/a' if result['precision'] is None else '{:.3f}'.format(result['precision']),
+            'n/a' if result['recall'] is None else '{:.3f}'.format(result['recall']),
+            result['reference']
+        ))
+
+    print('\n\t{:<14}{:>8}{:>10}{:>10}{:>10}'.format('stage', 'count', 'p50 ms', 'p90 ms', 'p99 ms'))
+
+    for stage, stats in sorted(result['stages'].items()):
+        print('\t{:<14}{:>8}{:>10.2f}{:>10.2f}{:>10.2f}'.format(
+            stage, stats['count'], *[stats['p{}'.format(q)] * 1000 for q in PERCENTILES]
+        ))
+
+def loop_decode_detections(raw_detections, W, H):
+    """
+    The original row by row YOLO decode, kept as a reference for bench_yolo_decode.
+    """
+    from housecarl.library.detectors.yolo import CONF_THRESH, NMS_THRESH
+
+    class_ids = []
+    confs = []
+    boxes = []
+
+    for output_layer in raw_detections:
+        for detection in output_layer:
+            scores = detection[5:]
+            class_id = np.argmax(scores)
+            conf = scores[class_id]
+
+            center_x = int(detection[0] * W)
+            center_y = int(detection[1] * H)
+            w = int(detection[2] * W)
+            h = int(detection[3] * H)
+            x = center_x - w / 2
+            y = center_y - h / 2
+
+            class_ids.append(class_id)
+            confs.append(float(conf))
+            boxes.append([x, y, w, h])
+
+    indices = cv2.dnn.NMSBoxes(boxes, confs, CONF_THRESH, NMS_THRESH)
+
+    normalized_detections = []
+
+    for i in np.array(indices).flatten():
+        x, y, w, h = boxes[i][:4]
+        box = [round(x), round(y), round(x + w), round(y + h)]
+        normalized_detections.append((class_ids[i], confs[i], box))
+
+    return normalized_detections
+
+def get_synthetic_yolo_output(num_objects=20, seed=0):
+    """
+    Fake YOLOv3 416x416 output layers, with a few confident rows scattered among low scores.
+    """
+    rng = np.random.RandomState(seed)
+    layers = []
+
+    for num_rows in [507, 2028, 8112]:
+        layer = rng.uniform(0, 1, size=(num_rows, 85)).astype(np.float32)
+        layer[:, 2:4] *= 0.3
+        layer[:, 5:] *= 0.2
+
+        confident_rows = rng.choice(num_rows, num_objects, replace=False)
+        layer[confident_rows, 5 + rng.randint(0, 80, num_objects)] = rng.uniform(0.5, 1, num_objects)
+        layers.append(layer)
+
+    return layers
+
+def bench_yolo_decode(iterations=50, W=1400, H=788):
+    """
+    Compare the vectorized YOLO decode against the original loop, and verify they agree.
+    """
+    from housecarl.library.detectors.yolo import decode_detections
+
+    raw_detections = get_synthetic_yolo_output()
+
+    if decode_detections(raw_detections, W, H) != loop_decode_detections(raw_detections, W, H):
+        raise Exception('Vectorized YOLO decode does not match the loop decode')
+
+    results = {}
+
+    for name, decode in [('loop', loop_decode_detections), ('vectorized', decode_detections)]:
+        started_at = time()
+
+        for i in range(iterations):
+            decode(raw_detections, W, H)
+
+        results[name] = (time() - started_at) / iterations
+        utility.info('{} YOLO decode: {:.2f} ms'.format(name, results[name] * 1000))
+
+    utility.info('Speedup: {:.1f}x\n'.format(results['loop'] / results['vectorized']))
+
+    return results
+
+def check_coral_pipeline(num_devices=2, num_frames=10, inference_size=(32, 32)):
+    """
+    Drive the CoralPipeline with fake interpreters, and verify frames are dispatched to the devices round robin,
+    results come back in the order of the frames, and a frame that fails to preprocess doesn't stall the rest.
+    """
+    from housecarl.library.detectors.coral_pipeline import CoralPipeline
+
+    def invoke(device, input_bytes):
+        # the fake interpreters are device numbers, and each frame is filled with its index
+        return [(device, input_bytes[0])]
+
+    pipeline = CoralPipeline(list(range(num_devices)), inference_size, invoke)
+    frames = [np.full((48, 64, 3), i, dtype=np.uint8) for i in range(num_frames)]
+
+    try:
+        raw_detections_batch = pipeline.run(frames)
+
+        if raw_detections_batch != [[(i % num_devices, i)] for i in range(num_frames)]:
+            raise Exception('Coral pipeline results are out of order or were not dispatched round robin: {}'.format(raw_detections_batch))
+
+        # None can't be resized, so the middle frame fails to preprocess
+        raw_detections_batch = pipeline.run(frames[:2] + [None] + frames[2:4])
+
+        if [len(raw_detections) for raw_detections in raw_detections_batch] != [1, 1, 0, 1, 1]:
+            raise Exception('Coral pipeline did not skip a frame that failed to preprocess: {}'.format(raw_detections_batch))
+    finally:
+        pipeline.stop()
+
+    utility.info('Coral pipeline dispatched {} frames round robin across {} fake devices, in order.\n'.format(num_frames, num_devices))
+
+    return raw_detections_batch
+
+def bench(argv=None):
+    """
+    Replay recorded video through the Detector and Monitor with display, push and write disabled,
+    and report throughput, per stage latency percentiles and peak RSS for each model.
+    """
+    args = get_args(argv if argv is not None else sys.argv[2:])
+
+    if args.get('yolo_decode'):
+        return bench_yolo_decode()
+
+    if args.get('coral_pipeline'):
+        return check_coral_pipeline()
+
+    if not args.get('path'):
+        raise Exception('carl bench needs a path to a video file or a directory of recordings')
+
+    config = get_config(args.get('config'))
+    video_paths = get_video_paths(args.get('path'))
+
+    if not video_paths:
+        raise Exception('No videos found at {}'.format(args.get('path')))
+
+    width = args.get('width') or config['video'].get('width')
+    results = []
+
+    for model in args.get('models'):
+        utility.info('Benchmarking {} on {} videos...'.format(model, len(video_paths)))
+
+        try:
+            result = run_model(model, config, video_paths, width, args.get('max_frames'))
+        except Exception as e:
+            result = {'model': model, 'error': str(e)}
+
+        reference = results[0] if results else result
+        if 'detections' in result and 'detections' in reference:
+            add_accuracy(result, reference)
+
+        print_result(result)
+        results.append(result)
+
+    if args.get('json'):
+        with open(args.get('json'), 'w') as f:
+            json.dump([{k: v for k, v in result.items() if k != 'detections'} for result in results], f, indent=2)
+
+    # peak RSS only grows, so later models include the memory of earlier ones
+    if len(results) > 1:
+        utility.info('Peak RSS is cumulative across models. Run one model at a time to compare memory.\n')
+
+    return results
@@ -1,6 +1,7 @@
 import argparse
 
 from housecarl.library.common import utility
+from housecarl.library.detectors import models
 from housecarl.library.common.constants import default_config_path
 
 class CLI:
@@ -28,7 +29,7 @@ class CLI:
         ap.add_argument('--server-debug', action="store_true", help='Whether to start the  server in debug mode')
         ap.add_argument('--server-only', action="store_true", help="Only start the server, and nothing else.")
         ap.add_argument('--width', default=None, help='Video Width.')
-        ap.add_argument('--model', default=None, help='Model to use. Either "yolo" or "mobilenet".')
+        ap.add_argument('--model', default=None, help='Model to use. One of "mobilenet", "yolo", "coral" or "onnx".')
 
         self.__args = vars(ap.parse_args())
 
@@ -130,10 +131,11 @@ class CLI:
 
         # throw an error if the config_value is not of the expected type
         expected_type = utility.get_typename(self.get(group_name, config_key))
+        config_value = utility.coerce_type(config_value, expected_type)
         config_value_type = utility.get_typename(config_value)
         if config_value_type != expected_type:
-            if config_key == 'src' and (config_value_type == 'int' or config_value_type == 'str'):
-                # allow string or int for video.src
+            if config_key == 'src' and config_value_type in ['int', 'str', 'list']:
+                # allow string, int, or list of sources for video.src
                 pass
             else:
                 raise Exception(
@@ -158,8 +160,27 @@ class CLI:
 
         return None
 
-    def get_detector_config(self):
-        return self.get_config_group('detector')
+    def get_detector_config(self, variant=None):
+        """
+        Return the detector config group, with the values of a model variant applied.
+        variant defaults to detector.variant. See housecarl.library.detectors.models for the available variants.
+        """
+        detector_config = self.get_config_group('detector')
+
+        if detector_config is None:
+            return None
+
+        variant = variant or detector_config.get('variant')
+
+        if not variant:
+            return detector_config
+
+        overrides = models.get_variant(variant, detector_config.get('variants'))
+
+        return CLI_Override_Group(self, 'detector', overrides)
+
+    def get_motion_config(self):
+        return self.get_config_group('motion')
 
     def get_writer_config(self):
         return self.get_config_group('writer')
@@ -186,6 +207,19 @@ class CLI:
     def get_video_config(self):
         return self.get_config_group('video')
 
+    def get_video_configs(self):
+        """
+        Return a video config group for each camera.
+        A single video.src yields a single group. A list of sources yields one group per source.
+        """
+        video_config = self.get_video_config()
+        sources = video_config.get('src')
+
+        if utility.get_typename(sources) != 'list':
+            return [video_config]
+
+        return [CLI_Camera_Group(self, 'video', index, source) for index, source in enumerate(sources)]
+
     def should_setup_coral(self):
         return self.__args.get('setup_coral')
 
@@ -205,4 +239,54 @@ class CLI_Group:
         self.__cli.set(self.__group_name, config_key, config_value)
 
     def dict(self):
-        self.__cli.get_group_dict(self.__group_name)
+        return self.__cli.get_group_dict(self.__group_name)
+
+class CLI_Override_Group(CLI_Group):
+    def __init__(self, cli: CLI, group_name: str, overrides: dict):
+        """
+        A view of a config group with some of its values overridden.
+        Values set on the view only apply to the view.
+        """
+        super().__init__(cli, group_name)
+
+        self.__overrides = overrides.copy()
+
+    def get(self, config_key):
+        if config_key in self.__overrides:
+            return self.__overrides.get(config_key)
+
+        return super().get(config_key)
+
+    def set(self, config_key, config_value):
+        if config_key in self.__overrides:
+            self.__overrides[config_key] = config_value
+        else:
+            super().set(config_key, config_value)
+
+    def dict(self):
+        group = super().dict()
+        group.update(self.__overrides)
+
+        return group
+
+class CLI_Camera_Group(CLI_Override_Group):
+    def __init__(self, cli: CLI, group_name: str, index: int, source):
+        """
+        A view of a config group for a single camera.
+
+        source is either a src (str or int) or a dict of values that override the group for this camera.
+        Values set on a camera group only apply to that camera.
+        """
+        is_dict = utility.get_typename(source) == 'dict'
+        overrides = source.copy() if is_dict else {'src': source}
+
+        if 'src' not in overrides:
+            raise Exception('Camera {} in config.{}.src is missing a src'.format(index, group_name))
+
+        # every camera needs a distinct window and recording name
+        if 'name' not in overrides:
+            overrides['name'] = '{} {}'.format(cli.get(group_name, 'name'), index)
+
+        super().__init__(cli, group_name, overrides)
+
+        self.index = index
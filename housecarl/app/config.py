@@ -55,19 +55,21 @@ class Config:
 
             is_video = config_group_name == 'video'
             is_writer = config_group_name == 'writer'
+            is_motion = config_group_name == 'motion'
             is_monitor = config_group_name == 'monitor'
             is_pushover = config_group_name == 'pushover'
 
             # skip if no config provided or if skip requested
             skip_monitor = is_monitor and no_monitor
             skip_write = is_writer and (no_write or not configuration_found)
+            skip_motion = is_motion and not configuration_found
             skip_push = is_pushover and (no_pushover or not configuration_found)
 
             # skip everything but video if we're not detecting
             skip_detect = no_detect and not is_video
 
             # respect cli arg overrides
-            if skip_push or skip_write or skip_detect or skip_monitor:
+            if skip_push or skip_write or skip_detect or skip_monitor or skip_motion:
                 continue
 
             # if no user supplied config for this group, use group defaults
@@ -93,14 +95,14 @@ class Config:
             
             for key, default_value in config_group_defaults.items():
                 user_key_found = key in user_config_group
-                user_value = user_config_group.get(key)
-                user_value_type = utility.get_typename(user_value)
                 default_value_type = utility.get_typename(default_value)
+                user_value = utility.coerce_type(user_config_group.get(key), default_value_type)
+                user_value_type = utility.get_typename(user_value)
                 invalid_value_type = user_key_found and user_value_type != default_value_type
 
-                # allow string or int for video.src
+                # allow string, int, or a list of sources for video.src
                 if key == 'src' and invalid_value_type:
-                    if user_value_type == 'str' or user_value_type == 'int':
+                    if user_value_type in ['str', 'int', 'list']:
                         invalid_value_type = False
                 elif key == 'mock' and not user_key_found:
                     # if they didn't pass a mock, don't override
@@ -1,12 +1,86 @@
+import sys
+
 from housecarl.app.cli import CLI
+from housecarl.app.bench import bench
 from housecarl.library.common import utility
 from housecarl.library.monitor import Monitor
 from housecarl.library.notifier import Pushover
-from housecarl.library.detectors import Detector
-from housecarl.library.camera import Video, Writer
+from housecarl.library.detectors import Detector, MotionGate, InferenceScheduler, Roi, Tracker
+from housecarl.library.camera import Video, Writer, Cameras
 from housecarl.library.server.server import Server
 from housecarl.library.setup.coral import setup_coral
 
+def __build_video(stream, video_config, detector, name=None, writer_config=None, monitor_config=None, motion_config=None, pushover=None):
+    """
+    Wire a single camera to its own Writer, Monitor, MotionGate, InferenceScheduler, Tracker and Roi, sharing the detector and pushover.
+    """
+    writer = None
+    monitor = None
+    roi = None
+    handle_frame = None
+    handle_alert = None
+    frame_detector = detector
+
+    if pushover:
+        handle_alert = lambda message: pushover.send_push_notification(
+            message if not name else '{}: {}'.format(name, message)
+        )
+
+    if writer_config:
+        writer = Writer(writer_config, name=name, src=video_config.get('src'))
+
+    if monitor_config:
+        monitor = Monitor(
+            config=monitor_config,
+            writer=writer,
+            pushover=pushover,
+            name=name
+        )
+
+    if detector and motion_config:
+        frame_detector = MotionGate(motion_config, detector, regions=video_config.get('motion_regions'))
+
+    if detector:
+        frame_detector = InferenceScheduler(
+            detector.config,
+            frame_detector,
+            monitor=monitor,
+            target_fps=video_config.get('target_fps'),
+            idle_fps=video_config.get('idle_fps'),
+            tracker=Tracker(detector.config) if detector.config.get('tracker') else None
+        )
+
+        if video_config.get('roi') or video_config.get('tile_size'):
+            roi = Roi(video_config.get('roi'), tile_size=video_config.get('tile_size'), tile_overlap=video_config.get('tile_overlap'))
+
+        handle_detections = None if not monitor else monitor.handle_detections
+        
+        handle_frame = lambda frame: frame_detector.process_frame(
+            frame,
+            on_detections=handle_detections,
+            stream=stream,
+            roi=roi
+        )
+
+    def handle_exit():
+        if monitor:
+            monitor.finish_recording()
+
+        if writer:
+            writer.close()
+
+        # a shared detector is only terminated once every camera has stopped
+        if detector and name is None:
+            detector.terminate_thread()
+
+    return Video(
+        config=video_config,
+        on_frame=handle_frame,
+        on_exit=handle_exit,
+        on_alert=handle_alert,
+        name=name
+    )
+
 def __main(video):
     cli = CLI()
 
@@ -16,16 +90,13 @@ def __main(video):
     cli.print_config()
 
     server = None
-    writer = None
-    monitor = None
-    detector = None
     pushover = None
-    handle_frame = None
-    handle_alert = None
+    detectors = {}
 
     server_config = cli.get_server_config()
     writer_config = cli.get_writer_config()
     monitor_config = cli.get_monitor_config()
+    motion_config = cli.get_motion_config()
     detector_config = cli.get_detector_config()
     pushover_config = cli.get_pushover_config()
 
@@ -36,53 +107,59 @@ def __main(video):
         if server_config.get("server_only"):
             return
 
-    if detector_config:
-        utility.info('Loading detector...\n')
-        detector = Detector(detector_config)
+    def get_detector(variant):
+        """
+        Cameras that use the same model variant share a single detector.
+        """
+        if not detector_config:
+            return None
+
+        if variant not in detectors:
+            utility.info('Loading detector{}...\n'.format(' variant ' + variant if variant else ''))
+            detectors[variant] = Detector(cli.get_detector_config(variant=variant))
+
+            # warm the net up while the cameras connect
+            detectors[variant].warm_up()
+
+        return detectors[variant]
 
     if pushover_config:
         pushover = Pushover(pushover_config)
-        handle_alert = lambda message: pushover.send_push_notification(message)
-
-    if writer_config:
-        writer = Writer(writer_config)
 
-    if monitor_config:
-        monitor = Monitor(
-            config=monitor_config,
-            writer=writer,
+    # video is always required
+    video_configs = cli.get_video_configs()
+    is_multi_camera = len(video_configs) > 1
+
+    videos = [
+        __build_video(
+            stream,
+            video_config,
+            get_detector(video_config.get('variant') or (detector_config and detector_config.get('variant'))),
+            name=video_config.get('name') if is_multi_camera else None,
+            writer_config=writer_config,
+            monitor_config=monitor_config,
+            motion_config=motion_config,
             pushover=pushover
         )
+        for stream, video_config in enumerate(video_configs)
+    ]
 
-    if detector:
-        handle_detections = None if not monitor else monitor.handle_detections
-        
-        handle_frame = lambda frame: detector.process_frame(
-            frame,
-            on_detections=handle_detections
-        )
+    if not is_multi_camera:
+        utility.info('Starting video stream...')
+        return videos[0].start()
 
     def handle_exit():
-        if monitor:
-            monitor.finish_recording()
+        [detector.terminate_thread() for detector in detectors.values()]
 
-        if detector:
-            detector.terminate_thread()
-
-    # video is always required
-    video = Video(
-        config=cli.get_video_config(),
-        on_frame=handle_frame,
-        on_exit=handle_exit,
-        on_alert=handle_alert,
-    )
-
-    utility.info('Starting video stream...')
-    video.start()
+    cameras = Cameras(videos, on_exit=handle_exit)
+    cameras.start()
 
 def carl():
     video = None
 
+    if sys.argv[1:2] == ['bench']:
+        return bench()
+
     try:
         __main(video)
     except (KeyboardInterrupt, Exception) as exception:
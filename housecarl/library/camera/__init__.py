@@ -1,2 +1,3 @@
 from housecarl.library.camera.video import Video
 from housecarl.library.camera.writer import Writer
+from housecarl.library.camera.cameras import Cameras
@@ -0,0 +1,61 @@
+import cv2
+from time import sleep
+
+from housecarl.library.common import utility
+
+class Cameras:
+    def __init__(self, videos, on_exit=None):
+        """
+        Run several Video loops in a single process.
+
+        videos is a list of Video instances. Each one runs its loop in a background thread,
+        while the main thread draws any displayed frames.
+
+        on_exit is an optional function that will be called once every video has stopped.
+        """
+        self.__videos = videos
+        self.__on_exit = on_exit
+        self.__looping = False
+
+    def __displaying(self):
+        return any(video.config.get('display') for video in self.__videos)
+
+    def __run_loop(self):
+        self.__looping = True
+
+        while self.__looping and any(video.is_looping() for video in self.__videos):
+            if not self.__displaying():
+                sleep(0.1)
+                continue
+
+            [video.show() for video in self.__videos]
+
+            key = cv2.waitKey(1) & 0xFF
+
+            if key == ord('q'):
+                break
+
+        self.stop()
+
+    def start(self):
+        """
+        Start every video stream and block until they have all stopped.
+        """
+        utility.info('Starting {} video streams...'.format(len(self.__videos)))
+
+        [video.start(blocking=False) for video in self.__videos]
+
+        self.__run_loop()
+
+    def stop(self):
+        """
+        Terminate every video loop.
+        """
+        self.__looping = False
+
+        [video.stop() for video in self.__videos]
+
+        if self.__on_exit:
+            on_exit = self.__on_exit
+            self.__on_exit = None
+            on_exit()
@@ -0,0 +1,140 @@
+import os
+from datetime import datetime
+
+from housecarl.library.common import utility, metrics
+from housecarl.library.camera import frame_pool, video_codecs, encoder_pool
+
+class ContinuousRecorder:
+    def __init__(self, config, codec, name=None):
+        """
+        Record every frame into fixed length segments in the out_dir/<date>/ layout.
+
+        config is the writer CLI_Group and must contain the following keys:
+            out_dir: str
+            fps: int
+            encoder_threads: int - size of the shared encoder pool
+            queue_size: int - max number of frames waiting to be written. Frames past this are dropped.
+            continuous_segment_seconds: float - length of each segment
+            min_disk_space: float - segments are skipped while there are fewer GB free
+
+        codec is the codec to record with, from video_codecs.get_codec().
+
+        Segments are cut by frame count, so an offset of n / fps seconds into a segment is its nth frame.
+        """
+        self.config = config
+        self.name = name
+        self.__codec = codec
+        self.__num_dropped = 0
+        self.__frames_per_segment = max(1, int(config.get('fps') * config.get('continuous_segment_seconds')))
+
+        # only touched by the encoder pool, which writes one item of a stream at a time
+        self.__writer = None
+        self.__segment_path = None
+        self.__segment_shape = None
+        self.__segment_frames = 0
+        self.__out_of_space = False
+
+        # frames and markers share the stream, so a marker sees the position of the frame queued just before it
+        # the stream is unbounded so markers are never lost, and frames are bounded in update()
+        pool = encoder_pool.get_pool(config.get('encoder_threads'))
+        self.__stream = pool.open_stream(self.__write_item, self.__close_segment)
+
+    def __get_segment_path(self):
+        timestamp = datetime.now()
+        date = timestamp.strftime("%Y-%m-%d")
+        date_dir = os.path.join(self.config.get('out_dir'), date)
+        utility.ensure_dir(date_dir)
+
+        filename = '{}_{}_continuous'.format(date, timestamp.strftime("%Hh%Mm%Ss"))
+
+        if self.name:
+            filename = '{}_{}'.format(utility.slugify(self.name), filename)
+
+        # segments shorter than a second, or cut short by a change of frame size, would share a name
+        return utility.get_unique_path(os.path.join(date_dir, '{}.{}'.format(filename, self.__codec['file_format'])))
+
+    def __close_segment(self):
+        if self.__writer is not None:
+            error = self.__writer.release()
+            self.__writer = None
+
+            if error:
+                utility.error('Could not save the recording to {}: {}'.format(self.__segment_path, error))
+
+    def __has_disk_space(self):
+        free_disk_space = utility.get_free_space()
+        min_disk_space = self.config.get('min_disk_space')
+
+        if free_disk_space < min_disk_space:
+            if not self.__out_of_space:
+                utility.error('Remaining disk space is too small to record video: {} < {}. Skipping segments until there is room.'.format(free_disk_space, min_disk_space))
+
+            self.__out_of_space = True
+            return False
+
+        if self.__out_of_space:
+            utility.info('Disk space is available again. Resuming continuous recording.')
+
+        self.__out_of_space = False
+        return True
+
+    def __open_segment(self, shape):
+        self.__close_segment()
+
+        self.__segment_path = None
+        self.__segment_shape = shape
+        self.__segment_frames = 0
+
+        # without room, the frames of this segment are skipped and the space is checked again at the next one
+        if not self.__has_disk_space():
+            return
+
+        (frame_height, frame_width) = shape[:2]
+        self.__segment_path = self.__get_segment_path()
+        self.__writer = video_codecs.open_video_writer(self.__segment_path, self.__codec, self.config.get('fps'), (frame_width, frame_height))
+
+    def __write_frame(self, frame):
+        # start a new segment when this one is full, or the frame size changed
+        if self.__segment_shape is None or self.__segment_frames >= self.__frames_per_segment or frame.shape != self.__segment_shape:
+            self.__open_segment(frame.shape)
+
+        if self.__writer is not None:
+            with metrics.timer('continuous_write', camera=self.name or 'default'):
+                self.__writer.write(frame)
+
+        self.__segment_frames += 1
+
+    def __write_item(self, item):
+        if callable(item):
+            # a skipped segment has no position
+            offset = self.__segment_frames / self.config.get('fps') if self.__segment_path else None
+            item(self.__segment_path, offset)
+            return
+
+        try:
+            self.__write_frame(item)
+        finally:
+            frame_pool.release(item)
+
+    def update(self, frame):
+        # when the encoder can't keep up, drop frames rather than stall the capture loop
+        if self.__stream.qsize() >= self.config.get('queue_size'):
+            self.__num_dropped += 1
+            metrics.set_gauge('continuous_dropped_frames', self.__num_dropped, camera=self.name or 'default')
+            return
+
+        self.__stream.put(frame_pool.retain(frame))
+
+    def mark(self, on_position):
+        """
+        Call on_position(segment_path, offset_seconds) from the encoder pool with the position of the latest frame passed to update(),
+        once it has been written.
+        """
+        self.__stream.put(on_position)
+
+    def stop(self):
+        """
+        Write the queued frames and close the segment.
+        """
+        self.__stream.close()
+        self.__stream.join()
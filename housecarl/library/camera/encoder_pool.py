@@ -0,0 +1,127 @@
+import os
+from queue import Queue
+from threading import Thread, Lock, Event
+from collections import deque
+
+from housecarl.library.common import utility
+
+# items a worker writes from one stream before giving the other streams a turn
+BATCH_SIZE = 16
+
+# put by EncoderStream.close() after the last item
+_CLOSE = object()
+
+_pool = None
+_pool_lock = Lock()
+
+class EncoderStream:
+    def __init__(self, pool, write, close):
+        """
+        An ordered queue of items for one video file, written by the threads of an EncoderPool.
+
+        write(item) is called for each item, in the order they were put, and never by two threads at once.
+        close() is called once, after the last item.
+        """
+        self.__pool = pool
+        self.__write = write
+        self.__close = close
+
+        self.__lock = Lock()
+        self.__items = deque()
+        self.__scheduled = False
+        self.__done = Event()
+
+    def put(self, item):
+        with self.__lock:
+            self.__items.append(item)
+
+            # a stream waits in the pool at most once, so only one thread writes it at a time
+            schedule = not self.__scheduled
+            self.__scheduled = True
+
+        if schedule:
+            self.__pool._schedule(self)
+
+    def qsize(self):
+        return len(self.__items)
+
+    def close(self):
+        """
+        Write the remaining items and close the stream in the background.
+        """
+        self.put(_CLOSE)
+
+    def is_done(self):
+        return self.__done.is_set()
+
+    def join(self):
+        """
+        Wait until the stream has been closed.
+        """
+        self.__done.wait()
+
+    def _run(self):
+        for _ in range(BATCH_SIZE):
+            with self.__lock:
+                if not self.__items:
+                    self.__scheduled = False
+                    return
+
+                item = self.__items.popleft()
+
+            if item is _CLOSE:
+                try:
+                    self.__close()
+                except Exception as e:
+                    utility.error('Could not save the recording: {}'.format(e))
+
+                self.__done.set()
+                return
+
+            # an item that can't be written shouldn't stall the rest of the recording
+            try:
+                self.__write(item)
+            except Exception as e:
+                utility.error('Could not write to the recording: {}'.format(e))
+
+        # there's more to write, go to the back of the line
+        self.__pool._schedule(self)
+
+class EncoderPool:
+    def __init__(self, num_threads):
+        """
+        A fixed number of threads that write the frames of every recording.
+
+        OpenCV releases the GIL while it encodes, so recordings from several cameras are encoded on several cores at once,
+        while the number of encoder threads stays the same however many recordings are in progress.
+        """
+        self.__ready = Queue()
+
+        for i in range(num_threads):
+            t = Thread(target=self.__work, args=())
+            t.daemon = True
+            t.start()
+
+    def _schedule(self, stream):
+        self.__ready.put(stream)
+
+    def __work(self):
+        while True:
+            stream = self.__ready.get()
+            stream._run()
+
+    def open_stream(self, write, close):
+        return EncoderStream(self, write, close)
+
+def get_pool(num_threads=0):
+    """
+    The encoder pool shared by every camera, created with num_threads threads on first use.
+    0 uses a thread per cpu.
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = EncoderPool(num_threads or os.cpu_count() or 1)
+
+    return _pool
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+from threading import Lock
+
+from housecarl.library.common import utility
+
+INDEX_FILENAME = 'events.db'
+
+class EventIndex:
+    def __init__(self, out_dir):
+        """
+        An SQLite index of detection events, stored in out_dir next to the recordings.
+
+        Each event points at the recording it starts in and the one it ends in, with an offset in seconds into each,
+        so an event can be played back by seeking into the recordings instead of cutting a separate clip.
+        Recording paths are relative to out_dir, i.e. "<date>/<video name>".
+        """
+        self.__out_dir = out_dir
+        self.__path = os.path.join(out_dir, INDEX_FILENAME)
+        self.__lock = Lock()
+
+        utility.ensure_dir(out_dir)
+
+        # events are added from writer threads
+        self.__connection = sqlite3.connect(self.__path, check_same_thread=False)
+        self.__connection.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                camera TEXT,
+                started_at REAL,
+                ended_at REAL,
+                label TEXT,
+                confidence REAL,
+                start_video TEXT,
+                start_offset REAL,
+                end_video TEXT,
+                end_offset REAL
+            )
+        ''')
+        self.__connection.execute('CREATE INDEX IF NOT EXISTS events_started_at ON events (started_at)')
+        self.__connection.commit()
+
+    def __get_relative_path(self, path):
+        return os.path.relpath(path, self.__out_dir) if path else None
+
+    def add_event(self, camera, started_at, ended_at, label, confidence, start_video, start_offset, end_video, end_offset):
+        row = (
+            camera,
+            started_at,
+            ended_at,
+            label,
+            float(confidence) if confidence is not None else None,
+            self.__get_relative_path(start_video),
+            start_offset,
+            self.__get_relative_path(end_video),
+            end_offset
+        )
+
+        with self.__lock:
+            self.__connection.execute('''
+                INSERT INTO events (camera, started_at, ended_at, label, confidence, start_video, start_offset, end_video, end_offset)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', row)
+            self.__connection.commit()
+
+    def get_events(self, since=None, limit=500):
+        """
+        Return the newest events as dicts, newest first.
+        """
+        query = 'SELECT * FROM events'
+        params = []
+
+        if since is not None:
+            query += ' WHERE started_at >= ?'
+            params.append(since)
+
+        query += ' ORDER BY started_at DESC LIMIT ?'
+        params.append(limit)
+
+        with self.__lock:
+            cursor = self.__connection.execute(query, params)
+            columns = [column[0] for column in cursor.description]
+
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
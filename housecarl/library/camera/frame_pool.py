@@ -0,0 +1,96 @@
+import numpy as np
+from threading import Lock
+
+# the pool that owns each pooled buffer, keyed by id(buffer)
+# pools keep their buffers alive until they are closed, which removes their ids, so these ids are never reused
+_owners = {}
+
+class FramePool:
+    def __init__(self, max_size):
+        """
+        A pool of preallocated, reference counted frame buffers.
+
+        Buffers are allocated on demand, up to max_size, and reused once every holder has released them.
+        When the pool is exhausted, acquire() falls back to a regular allocation that is not pooled.
+
+        Every stage that holds on to a frame past the current loop iteration must retain() it, and release() it when done.
+        retain() and release() are no-ops for frames that did not come from a pool, so stages don't need to know where a frame came from.
+        """
+        self.__max_size = max_size
+        self.__lock = Lock()
+        self.__buffers = {}
+        self.__ref_counts = {}
+        self.__free = {}
+
+    def acquire(self, shape, dtype=np.uint8):
+        """
+        Get a buffer with a reference count of 1. Its contents are undefined.
+        """
+        key = (tuple(shape), np.dtype(dtype).str)
+
+        with self.__lock:
+            free = self.__free.get(key)
+
+            if free:
+                buffer = free.pop()
+            elif len(self.__buffers) < self.__max_size:
+                buffer = np.empty(shape, dtype=dtype)
+                self.__buffers[id(buffer)] = (key, buffer)
+                _owners[id(buffer)] = self
+            else:
+                return np.empty(shape, dtype=dtype)
+
+            self.__ref_counts[id(buffer)] = 1
+
+        return buffer
+
+    def _retain(self, buffer):
+        with self.__lock:
+            self.__ref_counts[id(buffer)] += 1
+
+    def _release(self, buffer):
+        with self.__lock:
+            buffer_id = id(buffer)
+            self.__ref_counts[buffer_id] -= 1
+
+            if self.__ref_counts[buffer_id] <= 0:
+                self.__ref_counts[buffer_id] = 0
+                (key, buffer) = self.__buffers[buffer_id]
+                self.__free.setdefault(key, []).append(buffer)
+
+    def num_buffers(self):
+        return len(self.__buffers)
+
+    def close(self):
+        """
+        Forget every buffer, so the pool no longer keeps them alive.
+        Buffers still held elsewhere become regular arrays, and retain() and release() are no-ops for them.
+        The pool can be used again afterwards.
+        """
+        with self.__lock:
+            for buffer_id in self.__buffers:
+                _owners.pop(buffer_id, None)
+
+            self.__buffers = {}
+            self.__ref_counts = {}
+            self.__free = {}
+
+def retain(frame):
+    """
+    Take a reference to a pooled frame. Returns the frame.
+    """
+    pool = _owners.get(id(frame))
+
+    if pool is not None:
+        pool._retain(frame)
+
+    return frame
+
+def release(frame):
+    """
+    Give up a reference to a pooled frame. The buffer is reused once every reference has been released.
+    """
+    pool = _owners.get(id(frame))
+
+    if pool is not None:
+        pool._release(frame)
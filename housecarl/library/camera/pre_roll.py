@@ -0,0 +1,126 @@
+import cv2
+from time import time
+from queue import Queue, Full
+from threading import Thread, Lock
+from collections import deque
+
+from housecarl.library.common import utility, metrics
+from housecarl.library.camera import frame_pool
+
+PRE_ROLL_FORMATS = ['jpeg', 'raw']
+
+# frames waiting to be compressed. When the encoder falls this far behind, new frames are dropped from the pre-roll
+MAX_PENDING = 8
+
+class PreRollBuffer:
+    def __init__(self, seconds, buffer_format='jpeg', quality=80, name=None):
+        """
+        The last few seconds of video, kept so a recording can start before the event that triggered it.
+
+        seconds: int or float - how much video to keep
+        buffer_format: str - "jpeg" compresses each frame in a background thread, which takes a tenth of the memory of "raw" frames
+        quality: int - JPEG quality, 0-100
+
+        Items returned by drain() are either frames or compressed frames, and must be turned into frames with decode().
+        """
+        if buffer_format not in PRE_ROLL_FORMATS:
+            raise Exception('config.writer.buffer_format must be one of {}.'.format(PRE_ROLL_FORMATS))
+
+        self.name = name
+        self.__seconds = seconds
+        self.__format = buffer_format
+        self.__params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
+
+        self.__lock = Lock()
+        self.__items = deque()
+        self.__num_bytes = 0
+        self.__num_dropped = 0
+
+        if self.__format == 'jpeg':
+            self.__pending = Queue(maxsize=MAX_PENDING)
+
+            t = Thread(target=self.__encode, args=())
+            t.daemon = True
+            t.start()
+
+    def __append(self, added_at, item):
+        """
+        Add an item and drop items older than the buffer length. The lock must be held.
+        """
+        self.__items.append((added_at, item))
+        self.__num_bytes += item.nbytes
+
+        while self.__items and added_at - self.__items[0][0] > self.__seconds:
+            (_, old_item) = self.__items.popleft()
+            self.__num_bytes -= old_item.nbytes
+            frame_pool.release(old_item)
+
+        metrics.set_gauge('pre_roll_bytes', self.__num_bytes, camera=self.name or 'default')
+
+    def __compress(self, frame):
+        (ok, encoded) = cv2.imencode('.jpg', frame, self.__params)
+
+        if not ok:
+            raise Exception('Could not compress a frame for the pre-roll buffer.')
+
+        return encoded
+
+    def __encode(self):
+        while True:
+            (added_at, frame) = self.__pending.get()
+
+            try:
+                with metrics.timer('pre_roll_encode', camera=self.name or 'default'):
+                    encoded = self.__compress(frame)
+
+                with self.__lock:
+                    self.__append(added_at, encoded)
+            except Exception as e:
+                utility.error(str(e))
+            finally:
+                frame_pool.release(frame)
+                self.__pending.task_done()
+
+    def add(self, frame):
+        """
+        Add the latest frame. The buffer retains pooled frames for as long as it holds them.
+        """
+        added_at = time()
+
+        if self.__format == 'raw':
+            with self.__lock:
+                self.__append(added_at, frame_pool.retain(frame))
+
+            return
+
+        try:
+            self.__pending.put_nowait((added_at, frame_pool.retain(frame)))
+        except Full:
+            # never hold up the capture loop, a gap in the pre-roll is better than a stall
+            frame_pool.release(frame)
+            self.__num_dropped += 1
+            metrics.set_gauge('pre_roll_dropped_frames', self.__num_dropped, camera=self.name or 'default')
+
+    def drain(self):
+        """
+        Empty the buffer, returning its items oldest first.
+        Ownership of the items passes to the caller, who must frame_pool.release() them once decoded and written.
+        """
+        # wait for the few frames still being compressed, so the newest frames aren't missing from the recording
+        if self.__format == 'jpeg':
+            self.__pending.join()
+
+        with self.__lock:
+            items = [item for (added_at, item) in self.__items]
+            self.__items.clear()
+            self.__num_bytes = 0
+
+        return items
+
+    @staticmethod
+    def decode(item):
+        # compressed frames are 1d byte arrays
+        if item.ndim == 1:
+            return cv2.imdecode(item, cv2.IMREAD_COLOR)
+
+        return item
@@ -1,9 +1,9 @@
 import cv2
-import time
-from threading import Thread
-from collections import deque
+from threading import Thread, Condition, Event
 
-from housecarl.library.common import utility
+from housecarl.library.common import utility, metrics
+from housecarl.library.camera import frame_pool
+from housecarl.library.camera.frame_pool import FramePool
 
 # https://stackoverflow.com/a/58599708/8643833
 class ThreadedVideoReader:
@@ -21,19 +21,50 @@ class ThreadedVideoReader:
         [h264 @ 0x1915f60] cabac decode of qscale diff failed at 36 12
         [h264 @ 0x1915f60] error while decoding MB 36 12, bytestream 807
 
+    Consumers block in read() until a new frame arrives. Every frame is tagged with a sequence number,
+    so consumers can tell whether a frame is new without polling.
+
     @param src - IP/RTSP/Webcam source
     @param reconnect - Boolean, reconnect if disconnected (or video ends)
+    @param width - Int, resize frames to this width in the capture thread, off of the consumer's hot path
+    @param decode_every - Int, only decode every Nth frame. Dropped frames are grabbed but never retrieved
+    @param hw_decode - Boolean, ask the capture backend for hardware accelerated decoding
+    @param name - String, camera name used to label metrics
+    @param frame_pool_size - Int, max number of frame buffers to reuse. Frames returned by read() are
+        retained for the caller, who must frame_pool.release() them when done
+    @param wait_for_reader - Boolean, wait for each frame to be read before grabbing the next one, instead of
+        dropping frames the reader is too slow for. For replaying video files
     """
 
-    def __init__(self, src=0, reconnect=True):
+    def __init__(self, src=0, reconnect=True, width=None, decode_every=1, hw_decode=False, frame_pool_size=0, name=None, wait_for_reader=False):
         self.__src = src
         self.__looping = False
         self.__reconnect = reconnect
         self.__connection_thread = None
 
-        # Initialize deque used to store frames read from the stream
-        # maxlen=1 means we always reference the latest available frame
-        self.__deque = deque(maxlen=1)
+        self.__width = width
+        self.__hw_decode = hw_decode
+        self.__decode_every = max(1, decode_every or 1)
+        self.__wait_for_reader = wait_for_reader
+        self.__num_grabbed = 0
+        self.__name = name or 'default'
+
+        # frames are captured into reusable buffers
+        # the scratch buffer holds full resolution frames before they are resized into the pool
+        self.__frame_pool = FramePool(frame_pool_size)
+        self.__scratch = None
+        self.__capture_shape = None
+
+        # we always reference the latest available frame and its sequence number
+        # the condition is notified every time a new frame arrives
+        self.__frame = None
+        self.__sequence = 0
+        self.__last_read_sequence = 0
+        self.__newest_read_sequence = 0
+        self.__frame_ready = Condition()
+
+        # set when the reader is stopped so that any waits end immediately
+        self.__stopped = Event()
 
         # Flag to check if camera is valid/working
         self.__online = False
@@ -45,6 +76,7 @@ class ThreadedVideoReader:
             return
 
         self.__looping = True
+        self.__stopped.clear()
         self.__load_video_source()
 
         # Start background frame grabbing
@@ -53,10 +85,20 @@ class ThreadedVideoReader:
         self.__get_frame_thread.start()
 
 
+    def __open_capture(self):
+        # hardware decoding needs the capture params added in OpenCV 4.5.2
+        hw_acceleration = getattr(cv2, 'CAP_PROP_HW_ACCELERATION', None)
+
+        if self.__hw_decode and hw_acceleration is not None:
+            return cv2.VideoCapture(self.__src, cv2.CAP_ANY, [hw_acceleration, cv2.VIDEO_ACCELERATION_ANY])
+
+        return cv2.VideoCapture(self.__src)
+
+
     def __verify_video_source(self):
         """Checks if the video source is available"""
         utility.info('Verifying video source...')
-        cap = cv2.VideoCapture(self.__src)
+        cap = self.__open_capture()
 
         if not cap.isOpened():
             utility.warn('Could not connect to video source.')
@@ -75,7 +117,7 @@ class ThreadedVideoReader:
 
         def load_video_in_thread():
             if self.__verify_video_source():
-                self.__capture = cv2.VideoCapture(self.__src)
+                self.__capture = self.__open_capture()
                 self.__online = True
                 utility.info('Connected to stream: {}'.format(self.__src))
 
@@ -90,24 +132,101 @@ class ThreadedVideoReader:
         return self.__capture is not None and self.__capture.isOpened()
 
 
+    def __read_frame(self):
+        """
+        Grab the next frame, only retrieving and resizing it if it will be used.
+        Frames are read and resized into pooled buffers instead of new allocations.
+
+        Returns (status, frame), where frame is None for a dropped frame.
+        """
+        self.__num_grabbed += 1
+
+        if self.__num_grabbed % self.__decode_every:
+            with metrics.timer('grab', camera=self.__name):
+                return (self.__capture.grab(), None)
+
+        shape = self.__capture_shape
+        needs_resize = self.__width and (shape is None or shape[1] != self.__width)
+
+        if needs_resize:
+            buffer = self.__scratch
+        elif shape is not None:
+            buffer = self.__frame_pool.acquire(shape)
+        else:
+            buffer = None
+
+        with metrics.timer('capture', camera=self.__name):
+            status, raw = self.__capture.read(buffer) if buffer is not None else self.__capture.read()
+
+        # the capture allocates a new frame when the buffer doesn't fit, e.g. after a change in resolution
+        if not status or raw is not buffer:
+            frame_pool.release(buffer)
+
+        if not status:
+            return (False, None)
+
+        self.__capture_shape = raw.shape
+
+        if not self.__width or raw.shape[1] == self.__width:
+            # this frame is handed off, so it can't be used as scratch space
+            self.__scratch = None
+
+            return (True, raw)
+
+        self.__scratch = raw
+
+        (H, W) = raw.shape[:2]
+        height = int(H * self.__width / W)
+        frame = self.__frame_pool.acquire((height, self.__width) + raw.shape[2:], raw.dtype)
+
+        with metrics.timer('resize', camera=self.__name):
+            cv2.resize(raw, (self.__width, height), dst=frame, interpolation=cv2.INTER_AREA)
+
+        return (True, frame)
+
+
+    def __wait_for_read(self):
+        if not self.__wait_for_reader:
+            return
+
+        with self.__frame_ready:
+            self.__frame_ready.wait_for(lambda: self.__newest_read_sequence >= self.__sequence or not self.__looping)
+
+
     def __get_frame_in_thread(self):
         """
-        Reads frame and inserts into the dequeue
+        Reads frame and hands it to any waiting readers
         """
 
         while self.__looping:
             try:
                 if self.__connected() and self.__online:
                     # Read next frame from stream
-                    status, frame = self.__capture.read()
-
-                    if status:
-                        # if the frame is valid, replace the current frame in the queue with it
-                        self.__deque.append(frame)
+                    status, frame = self.__read_frame()
+
+                    if status and frame is None:
+                        # the frame was dropped
+                        continue
+                    elif status:
+                        self.__wait_for_read()
+
+                        # if the frame is valid, replace the current frame and wake up any readers
+                        with self.__frame_ready:
+                            # the reader's reference to the previous frame is no longer needed
+                            frame_pool.release(self.__frame)
+                            self.__frame = frame
+                            self.__sequence += 1
+                            self.__frame_ready.notify_all()
                     else:
+                        # let the reader have the last frame of a video file before going offline
+                        self.__wait_for_read()
+
                         # we need to reconnect to the camera next loop
                         self.__capture.release()
                         self.__online = False
+                elif self.__connection_thread is not None and not self.__online:
+                    # the first connection attempt is in progress
+                    self.__stopped.wait(.1)
                 elif self.__reconnect:
                     # check online uncase it changed mid loop (since separate thread)
                     if not self.__connection_thread and not self.__online:
@@ -116,31 +235,33 @@ class ThreadedVideoReader:
                         self.__load_video_source()
 
                         # pause for a beat either way
-                        self.__spin(2)
+                        self.__stopped.wait(2)
+                    else:
+                        # a connection attempt is in progress
+                        self.__stopped.wait(.1)
                 else:
                     utility.info('Video closing...')
                     break
-
-                self.__spin(.001)
             except AttributeError:
                 pass
 
         if self.__capture:
             self.__capture.release()
             self.__capture = None
+
+        # hand the buffers back, so a stopped reader doesn't keep its pool alive
+        with self.__frame_ready:
+            frame_pool.release(self.__frame)
+            self.__frame = None
+
+        self.__scratch = None
+        self.__capture_shape = None
+        self.__frame_pool.close()
         
         self.__looping = False
         self.__online = False
 
 
-    def __spin(self, seconds):
-        """Pause for set amount of seconds, replaces time.sleep so program doesn't stall"""
-
-        time_end = time.time() + seconds
-        while time.time() < time_end:
-            pass
-
-
     def streaming(self):
         return self.__looping
 
@@ -153,25 +274,53 @@ class ThreadedVideoReader:
 
     def stop(self):
         self.__looping = False
+        self.__stopped.set()
+
+        # wake any readers so they don't wait out their timeout
+        with self.__frame_ready:
+            self.__frame_ready.notify_all()
 
 
-    def read(self):
+    def get_sequence(self):
         """
-        Get the latest frame if it exists
+        Sequence number of the latest frame. Increments every time a new frame arrives.
+        """
+        return self.__sequence
+
+
+    def read_with_sequence(self, last_sequence=0, timeout=1):
+        """
+        Block until a frame newer than last_sequence arrives, or until timeout seconds have passed.
+
+        Returns (frame, sequence), or (None, last_sequence) if no new frame arrived.
+        The frame is retained for the caller, who must frame_pool.release() it when done.
         """
 
         if not self.streaming():
-            return None
-        if not self.__online:
-            self.__spin(1)
-            return None
+            return (None, last_sequence)
 
-        if self.__deque and self.__online:
-            # Grab latest frame
+        with self.__frame_ready:
+            has_new_frame = self.__frame_ready.wait_for(
+                lambda: self.__sequence > last_sequence or not self.__looping,
+                timeout=timeout
+            )
 
-            try:
-                frame = self.__deque.pop()
-            except IndexError:
-                frame = None
+            if not has_new_frame or not self.__online or self.__sequence <= last_sequence:
+                return (None, last_sequence)
+
+            # with wait_for_reader, the grab thread waits for this to move on
+            self.__newest_read_sequence = max(self.__newest_read_sequence, self.__sequence)
+            self.__frame_ready.notify_all()
+
+            return (frame_pool.retain(self.__frame), self.__sequence)
+
+
+    def read(self, timeout=1):
+        """
+        Get the next frame, waiting up to timeout seconds for it to arrive.
+        The frame is retained for the caller, who must frame_pool.release() it when done.
+        """
+
+        frame, self.__last_read_sequence = self.read_with_sequence(self.__last_read_sequence, timeout)
 
-            return frame
+        return frame
@@ -0,0 +1,223 @@
+import os
+import glob
+import shutil
+import subprocess
+from math import ceil
+from threading import Thread, Lock, Event
+from urllib.parse import urlparse
+
+from housecarl.library.common import utility
+
+# how often segments are checked for new, finished and expired files
+POLL_INTERVAL = 0.5
+
+# seconds to wait before restarting ffmpeg when the stream drops
+RESTART_DELAY = 5
+
+# segments are numbered rather than timestamped, so segments shorter than a second get distinct names
+SEGMENT_NUMBER_DIGITS = 9
+
+# sources ffmpeg can copy the compressed stream from
+STREAM_SCHEMES = ['rtsp', 'rtsps', 'rtmp', 'http', 'https']
+
+def is_ffmpeg_installed():
+    return shutil.which('ffmpeg') is not None
+
+def is_stream_source(src):
+    # webcams, the pi camera and video files only give us decoded frames
+    return utility.get_typename(src) == 'str' and urlparse(src).scheme.lower() in STREAM_SCHEMES
+
+class StreamRecorder:
+    def __init__(self, src, segment_dir, segment_seconds=2.0, buffer_seconds=5.0, name=None):
+        """
+        Record a camera's compressed stream without decoding or encoding it.
+
+        ffmpeg copies the stream into short segments in segment_dir, and only the last buffer_seconds of them are kept.
+        A recording is the segments from buffer_seconds before start() until the segment in progress at finish(),
+        joined into one file by a second ffmpeg process, again without re-encoding.
+
+        Recordings start and end on segment boundaries, so they may run up to segment_seconds longer on either side.
+        """
+        self.name = name
+        self.__src = src
+        self.__segment_dir = segment_dir
+        self.__segment_seconds = segment_seconds
+        self.__num_buffer_segments = max(1, ceil(buffer_seconds / segment_seconds))
+
+        self.__lock = Lock()
+        self.__stopped = Event()
+        self.__process = None
+        self.__recordings = []
+
+        # segments from a previous run would be mistaken for this run's
+        shutil.rmtree(segment_dir, ignore_errors=True)
+        utility.ensure_dir(segment_dir)
+
+        self.__thread = Thread(target=self.__run, args=())
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __start_process(self):
+        command = [
+            'ffmpeg', '-nostdin', '-loglevel', 'error',
+            '-rtsp_transport', 'tcp',
+            '-i', str(self.__src),
+            '-map', '0:v', '-map', '0:a?',
+            '-c', 'copy',
+            '-f', 'segment',
+            '-segment_time', str(self.__segment_seconds),
+            '-segment_format', 'mpegts',
+            '-reset_timestamps', '1',
+            '-segment_start_number', str(self.__get_next_segment_number()),
+            os.path.join(self.__segment_dir, '%0{}d.ts'.format(SEGMENT_NUMBER_DIGITS))
+        ]
+
+        # -rtsp_transport is only understood by rtsp inputs
+        if not str(self.__src).startswith('rtsp'):
+            command = command[:4] + command[6:]
+
+        self.__process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+
+    def __list_segments(self):
+        # names are zero padded sequence numbers, so they sort in recording order
+        return sorted(glob.glob(os.path.join(self.__segment_dir, '*.ts')))
+
+    def __get_next_segment_number(self):
+        # a restarted ffmpeg carries on after the segments already written, rather than overwriting them
+        segments = self.__list_segments()
+
+        return int(os.path.splitext(os.path.basename(segments[-1]))[0]) + 1 if segments else 0
+
+    def __get_completed_segments(self, segments):
+        # the newest segment is still being written, unless ffmpeg has stopped
+        if self.__process is not None and self.__process.poll() is None:
+            return segments[:-1]
+
+        return segments
+
+    def __run(self):
+        while not self.__stopped.is_set():
+            if self.__process is None or self.__process.poll() is not None:
+                if self.__process is not None:
+                    utility.warn('Stream recording stopped. Restarting in {} seconds.'.format(RESTART_DELAY))
+                    self.__stopped.wait(RESTART_DELAY)
+
+                if self.__stopped.is_set():
+                    break
+
+                self.__start_process()
+
+            self.__update()
+            self.__stopped.wait(POLL_INTERVAL)
+
+        self.__update()
+
+    def __update(self):
+        segments = self.__list_segments()
+        completed = self.__get_completed_segments(segments)
+
+        with self.__lock:
+            for recording in self.__recordings:
+                newest = recording['segments'][-1] if recording['segments'] else ''
+                last_segment = recording['last_segment']
+
+                # add every segment since the recording started, up to the one in progress when it finished
+                recording['segments'] += [
+                    segment for segment in segments
+                    if segment > newest and (last_segment is None or segment <= last_segment)
+                ]
+
+            done = [recording for recording in self.__recordings if self.__is_done(recording, completed)]
+            self.__recordings = [recording for recording in self.__recordings if recording not in done]
+
+            in_use = set(segment for recording in self.__recordings for segment in recording['segments'])
+
+        for recording in done:
+            self.__join_segments(recording)
+
+        # keep enough completed segments for the next pre-roll, and anything a recording still needs
+        expired = completed[:-self.__num_buffer_segments]
+
+        for segment in expired:
+            if segment not in in_use:
+                os.remove(segment)
+
+    def __is_done(self, recording, completed):
+        last_segment = recording['last_segment']
+
+        if last_segment is None:
+            return False
+
+        # an empty last_segment means nothing had been recorded when the recording finished
+        return not last_segment or last_segment in completed or self.__stopped.is_set()
+
+    def __join_segments(self, recording):
+        segments = [segment for segment in recording['segments'] if os.path.exists(segment)]
+
+        if not segments:
+            utility.error('No stream segments were recorded for {}'.format(recording['path']))
+            return
+
+        list_path = '{}.txt'.format(recording['path'])
+
+        with open(list_path, 'w') as f:
+            f.writelines(["file '{}'\n".format(segment.replace("'", "'\\''")) for segment in segments])
+
+        command = [
+            'ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-map', '0:v', '-map', '0:a?',
+            '-c', 'copy'
+        ]
+
+        if recording['path'].endswith('.mp4'):
+            command += ['-movflags', '+faststart']
+
+        result = subprocess.run(command + [recording['path']], stdin=subprocess.DEVNULL)
+        os.remove(list_path)
+
+        if result.returncode != 0:
+            utility.error('Could not save the stream recording to {}'.format(recording['path']))
+        else:
+            utility.info('Recording saved to {}'.format(recording['path']))
+
+    def start(self, output_path):
+        """
+        Begin a recording, starting with the buffered segments.
+        """
+        segments = self.__list_segments()
+        completed = self.__get_completed_segments(segments)
+        pre_roll = completed[-self.__num_buffer_segments:] + segments[len(completed):]
+
+        with self.__lock:
+            self.__recordings.append({'path': output_path, 'segments': pre_roll, 'last_segment': None})
+
+    def finish(self):
+        """
+        End the recording. Returns straight away, and the file is written once the segment in progress is complete.
+        """
+        segments = self.__list_segments()
+
+        with self.__lock:
+            for recording in self.__recordings:
+                if recording['last_segment'] is None:
+                    last_segments = recording['segments'][-1:] + segments[-1:]
+                    recording['last_segment'] = max(last_segments) if last_segments else ''
+
+    def stop(self):
+        """
+        Stop ffmpeg, saving any unfinished recordings with the segments written so far.
+        """
+        self.finish()
+        self.__stopped.set()
+
+        if self.__process is not None and self.__process.poll() is None:
+            self.__process.terminate()
+
+            try:
+                self.__process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.__process.kill()
+
+        # the polling thread saves any unfinished recordings on its way out
+        self.__thread.join()
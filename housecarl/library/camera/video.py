@@ -1,10 +1,12 @@
 import cv2
 import imutils
 from time import sleep, time
+from threading import Thread
 from imutils.video import VideoStream, FPS
 
-from housecarl.library.common import utility
+from housecarl.library.common import utility, metrics
 from housecarl.library.setup import pi_camera
+from housecarl.library.camera import frame_pool
 from housecarl.library.camera.read_video import ThreadedVideoReader
 
 TIMEOUT = 60 # TODO: Make this configurable
@@ -16,7 +18,9 @@ class Video:
         config,
         on_frame=None,
         on_exit=None,
-        on_alert=None
+        on_alert=None,
+        name=None,
+        replay=False
     ):
         """
         Instantiate an object capable of managing a CV2 Video Source.
@@ -29,7 +33,7 @@ class Video:
 
         on_frame is an optional function and is passed the following:
             frame: The current CV2 frame to be processed
-            stop: A function that will terminate the loop
+            stop: A function that will terminate the loop, once the current frame has been handled
 
             If on_frame has a function signature that accepts one argument, frame is passed.
             If on_frame has a function signature that accepts two arguments, frame and then stop is passed.
@@ -38,17 +42,28 @@ class Video:
         on_exit is an optional function that will be called when the video loop is closed
 
         on_alert is an optional function that will be called with an alert message. Handle this however you see fit...like by sending a push notification.
+
+        name is an optional camera name used to label metrics when running several cameras.
+
+        replay is for recorded video files. Every frame is passed to on_frame, instead of dropping frames when on_frame is slow,
+        and the loop stops at the end of the video instead of reconnecting. Not supported with usePiCamera.
         """
+        self.name = name
         self.__on_exit = on_exit
         self.__on_alert = on_alert
 
         self.config = config
 
         self.__fps = None
+        self.__thread = None
         self.__looping = False
+        self.__background = False
+        self.__display_frame = None
         self.__pass_stop = False
         self.__frame_check_at = time()
         self.__broken_stream = False
+        self.__last_sequence = 0
+        self.__stop_requested = False
         self.__verify_frame_handler(on_frame)
 
         # if src is a number like "0" coerce to an int
@@ -64,7 +79,18 @@ class Video:
 
             self.__vs = VideoStream(usePiCamera=True)
         else:
-            self.__vs = ThreadedVideoReader(self.config.get('src'))
+            width = self.config.get('width')
+
+            self.__vs = ThreadedVideoReader(
+                self.config.get('src'),
+                width=int(width) if width else None,
+                decode_every=self.config.get('decode_every'),
+                hw_decode=self.config.get('hw_decode'),
+                frame_pool_size=self.config.get('frame_pool_size'),
+                name=name,
+                reconnect=not replay,
+                wait_for_reader=replay
+            )
 
     def __verify_frame_handler(self, frame_handler):
         if frame_handler is not None:
@@ -77,9 +103,23 @@ class Video:
 
         self.__frame_handler = frame_handler
 
+    def __request_stop(self):
+        self.__stop_requested = True
+
     def __call_frame_handler(self, frame):
-        args = (frame, self.stop) if self.__pass_stop else (frame,)
-        self.__frame_handler(*args)
+        args = (frame, self.__request_stop) if self.__pass_stop else (frame,)
+
+        with metrics.timer('process', camera=self.name or 'default'):
+            self.__frame_handler(*args)
+
+    def __read(self):
+        # ThreadedVideoReader blocks until a frame newer than the last one we handled arrives
+        if isinstance(self.__vs, ThreadedVideoReader):
+            (frame, self.__last_sequence) = self.__vs.read_with_sequence(self.__last_sequence)
+
+            return frame
+
+        return self.__vs.read()
 
     def __run_loop(self):
         """
@@ -89,9 +129,14 @@ class Video:
         self.__looping = True
         
         while self.__looping:
-            frame = self.__vs.read()
+            frame = self.__read()
 
             if frame is None:
+                # a video file has ended and won't be reconnected
+                if isinstance(self.__vs, ThreadedVideoReader) and not self.__vs.streaming():
+                    self.stop()
+                    break
+
                 if time() - self.__frame_check_at > TIMEOUT:
                     # if we just detected a broken stream
                     if not self.__broken_stream:
@@ -119,35 +164,97 @@ class Video:
                 if self.__on_alert is not None:
                     self.__on_alert("Video stream detected again!")
 
-            if self.config.get('width'):
-                frame = imutils.resize(frame, width=int(self.config.get('width')))
+            self.__handle_frame(frame)
 
-            if self.__frame_handler:
-                self.__call_frame_handler(frame)
+            # frames from ThreadedVideoReader come from a pool and must be handed back
+            frame_pool.release(frame)
 
-            self.__fps.update()
+            # the frame handler asked to stop, which is done here so it isn't timed as part of the frame
+            if self.__stop_requested:
+                self.stop()
 
-            if self.config.get('display'):
-                cv2.imshow(self.config.get('name'), frame)
+    def __handle_frame(self, frame):
+        # ThreadedVideoReader has already resized the frame in its own thread
+        width = self.config.get('width')
+        if width and frame.shape[1] != int(width):
+            with metrics.timer('resize', camera=self.name or 'default'):
+                frame = imutils.resize(frame, width=int(width))
 
-                key = cv2.waitKey(1) & 0xFF
+        if self.__frame_handler:
+            self.__call_frame_handler(frame)
 
-                if key == ord('q'):
-                    self.stop()
-                    break
+        self.__fps.update()
 
-    def start(self):
-        """
-        Start the video stream and initiate the loop handler.
-        """
+        if self.config.get('display'):
+            # windows can only be drawn from the main thread, so leave the frame for show()
+            if self.__background:
+                last_display_frame = self.__display_frame
+                self.__display_frame = frame_pool.retain(frame)
+                frame_pool.release(last_display_frame)
+
+                return
+
+            cv2.imshow(self.config.get('name'), frame)
+
+            key = cv2.waitKey(1) & 0xFF
 
+            if key == ord('q'):
+                self.stop()
+
+    def __begin(self):
         self.__vs.start()
-        sleep(2)
+
+        # the pi camera needs a moment to settle its exposure
+        # ThreadedVideoReader.read waits for the first frame itself, so other sources start straight away
+        if self.config.get('src') == 'usePiCamera':
+            sleep(2)
+
+        # a background loop may have been stopped while the stream was connecting
+        if self.__background and not self.__looping:
+            return
 
         self.__fps = FPS().start()
 
         self.__run_loop()
 
+    def __begin_in_background(self):
+        # an exception would otherwise end the thread silently, leaving the video looking alive
+        try:
+            self.__begin()
+        except Exception as e:
+            utility.error('Video loop{} stopped: {}'.format(' for ' + self.name if self.name else '', e))
+            self.stop()
+
+    def start(self, blocking=True):
+        """
+        Start the video stream and initiate the loop handler.
+
+        Set blocking=False to run the loop in a background thread. The caller is then responsible for calling show().
+        """
+
+        if not blocking:
+            self.__looping = True
+            self.__background = True
+            self.__thread = Thread(target=self.__begin_in_background, args=())
+            self.__thread.daemon = True
+            self.__thread.start()
+
+            return
+
+        self.__begin()
+
+    def show(self):
+        """
+        Draw the latest frame from a background loop. Must be called from the main thread.
+        """
+        frame = self.__display_frame
+
+        if frame is not None and self.config.get('display'):
+            cv2.imshow(self.config.get('name'), frame)
+
+    def is_looping(self):
+        return self.__looping
+
     def stop(self):
         """
         Terminate the video loop and cleanup processes.
@@ -156,15 +263,23 @@ class Video:
             return
 
         self.__looping = False
-        self.__fps.stop()
-        utility.info('Elapsed time: {:.2f}'.format(self.__fps.elapsed()))
-        sleep(0.5)
-        
-        utility.info('Approx FPS: {:.2f}\n'.format(self.__fps.fps()))
-        cv2.waitKey(1)
-        cv2.destroyAllWindows()
+
+        if self.__fps:
+            self.__fps.stop()
+            utility.info('Elapsed time: {:.2f}'.format(self.__fps.elapsed()))
+            sleep(0.5)
+            
+            utility.info('Approx FPS: {:.2f}\n'.format(self.__fps.fps()))
+
+        # without a window there's nothing to close, and headless builds of OpenCV don't support these
+        if self.config.get('display'):
+            cv2.waitKey(1)
+            cv2.destroyAllWindows()
+
         self.__vs.stop()
-        cv2.waitKey(1)
+
+        if self.config.get('display'):
+            cv2.waitKey(1)
         
         if self.__on_exit:
             self.__on_exit()
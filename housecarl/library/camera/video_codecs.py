@@ -0,0 +1,222 @@
+import os
+import cv2
+import tempfile
+import subprocess
+import numpy as np
+from threading import Lock
+
+from housecarl.library.common import utility
+from housecarl.library.camera import stream_recorder
+
+# config.writer.codec values
+# ffmpeg_encoder is used through the ffmpeg command when it is installed, which lets us choose the encoder speed
+CODECS = {
+    'theora': {'fourcc': 'theo', 'file_format': 'ogv', 'ffmpeg_encoder': None},
+    'mjpeg': {'fourcc': 'MJPG', 'file_format': 'avi', 'ffmpeg_encoder': None},
+    'h264': {'fourcc': 'avc1', 'file_format': 'mp4', 'ffmpeg_encoder': 'libx264'},
+    'vp8': {'fourcc': 'VP80', 'file_format': 'webm', 'ffmpeg_encoder': 'libvpx'}
+}
+
+ENCODER_SPEEDS = ['fast', 'medium', 'slow']
+
+# ffmpeg options for each config.writer.encoder_speed. Faster presets make larger files
+SPEED_PRESETS = {
+    'libx264': {
+        'fast': ['-preset', 'ultrafast', '-tune', 'zerolatency'],
+        'medium': ['-preset', 'veryfast'],
+        'slow': ['-preset', 'medium']
+    },
+    'libvpx': {
+        'fast': ['-deadline', 'realtime', '-cpu-used', '8', '-b:v', '2M'],
+        'medium': ['-deadline', 'good', '-cpu-used', '4', '-b:v', '2M'],
+        'slow': ['-deadline', 'good', '-cpu-used', '0', '-b:v', '2M']
+    }
+}
+
+# MJPEG is built into OpenCV, so it can always be recorded
+FALLBACK_CODEC = 'mjpeg'
+
+# the codec chosen for each writer config, so every camera shares the result of a single probe
+_codecs = {}
+_codecs_lock = Lock()
+
+VIDEO_MIME_TYPES = {
+    '.ogv': 'video/ogg',
+    '.ogg': 'video/ogg',
+    '.mp4': 'video/mp4',
+    '.webm': 'video/webm',
+    '.mkv': 'video/x-matroska',
+    '.avi': 'video/x-msvideo'
+}
+
+def get_mime_type(filename):
+    """
+    The MIME type of a video file, or None when it isn't a video we record.
+    """
+    return VIDEO_MIME_TYPES.get(os.path.splitext(filename)[1].lower())
+
+class FFmpegVideoWriter:
+    def __init__(self, path, encoder_args, fps, dimensions):
+        """
+        Encode frames with the ffmpeg command, which are piped to it raw.
+
+        Has the same interface as cv2.VideoWriter, except release() returns why the file could not be saved, or None.
+        """
+        (width, height) = dimensions
+        self.__dimensions = dimensions
+        self.__path = path
+        self.__error = None
+
+        command = [
+            'ffmpeg', '-loglevel', 'error', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', '{}x{}'.format(width, height), '-r', str(fps), '-i', '-',
+            '-an'
+        ] + encoder_args + ['-pix_fmt', 'yuv420p']
+
+        # browsers can start playing before the whole file has loaded
+        if path.endswith('.mp4'):
+            command += ['-movflags', '+faststart']
+
+        self.__process = subprocess.Popen(command + [path], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+
+    def isOpened(self):
+        return self.__process.poll() is None
+
+    def write(self, frame):
+        # like cv2.VideoWriter, frames of the wrong size are skipped
+        if (frame.shape[1], frame.shape[0]) != self.__dimensions:
+            return
+
+        # once ffmpeg has exited the rest of the frames are skipped, rather than failing on each one
+        if self.__error:
+            return
+
+        try:
+            self.__process.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, ValueError):
+            self.__error = 'ffmpeg stopped accepting frames'
+            utility.error('Could not write to {}: {}.'.format(self.__path, self.__error))
+
+    def release(self):
+        try:
+            self.__process.stdin.close()
+        except BrokenPipeError:
+            self.__error = self.__error or 'ffmpeg stopped accepting frames'
+
+        return_code = self.__process.wait()
+
+        if return_code != 0:
+            self.__error = 'ffmpeg exited with code {}'.format(return_code)
+
+        return self.__error
+
+def open_video_writer(path, codec, fps, dimensions):
+    """
+    Open a writer for codec, as returned by get_codec(). dimensions is (width, height).
+    """
+    if codec['encoder_args'] is not None:
+        return FFmpegVideoWriter(path, codec['encoder_args'], fps, dimensions)
+
+    fourcc = cv2.VideoWriter_fourcc(*codec['fourcc'])
+
+    # OpenCV's own MJPEG encoder splits each frame between threads
+    if codec['fourcc'] == 'MJPG':
+        return cv2.VideoWriter(path, cv2.CAP_OPENCV_MJPEG, fourcc, fps, dimensions, True)
+
+    # let FFmpeg pick a hardware encoder when there is one
+    if codec['hw_acceleration'] and hasattr(cv2, 'VIDEOWRITER_PROP_HW_ACCELERATION'):
+        params = [cv2.VIDEOWRITER_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+        return cv2.VideoWriter(path, cv2.CAP_FFMPEG, fourcc, fps, dimensions, params)
+
+    return cv2.VideoWriter(path, fourcc, fps, dimensions, True)
+
+def __can_encode(codec):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'probe.{}'.format(codec['file_format']))
+        writer = open_video_writer(path, codec, 15, (64, 64))
+        is_opened = writer.isOpened()
+
+        for i in range(2):
+            writer.write(np.zeros((64, 64, 3), dtype=np.uint8))
+
+        # cv2.VideoWriter.release() returns None
+        error = writer.release()
+
+        return is_opened and not error and os.path.exists(path) and os.path.getsize(path) > 0
+
+def __get_candidates(config):
+    name = config.get('codec')
+    speed = config.get('encoder_speed')
+
+    # without a codec, fourcc and file_format are used as they are
+    if not name:
+        return [{
+            'name': config.get('fourcc'),
+            'fourcc': config.get('fourcc'),
+            'file_format': config.get('file_format'),
+            'encoder_args': None,
+            'hw_acceleration': False
+        }]
+
+    if name not in CODECS:
+        raise Exception('config.writer.codec must be one of {}.'.format(list(CODECS.keys())))
+
+    if speed not in ENCODER_SPEEDS:
+        raise Exception('config.writer.encoder_speed must be one of {}.'.format(ENCODER_SPEEDS))
+
+    codec = dict(CODECS[name], name=name, encoder_args=None, hw_acceleration=False)
+    candidates = []
+    encoder = codec['ffmpeg_encoder']
+
+    # a hardware encoder replaces the ffmpeg encoder, so it only applies to codecs that are encoded with ffmpeg
+    if config.get('hw_encoder'):
+        if encoder is None:
+            utility.warn('config.writer.hw_encoder is only used with the {} codecs. Ignoring it for {}.'.format([k for k, v in CODECS.items() if v['ffmpeg_encoder']], name))
+        else:
+            encoder = config.get('hw_encoder')
+
+    if encoder and stream_recorder.is_ffmpeg_installed():
+        encoder_args = ['-c:v', encoder] + SPEED_PRESETS.get(encoder, {}).get(speed, [])
+        candidates.append(dict(codec, name='{} ({})'.format(name, encoder), encoder_args=encoder_args))
+    elif encoder != codec['ffmpeg_encoder']:
+        utility.warn('config.writer.hw_encoder needs ffmpeg. Encoding with OpenCV instead.')
+
+    candidates.append(dict(codec, hw_acceleration=codec['ffmpeg_encoder'] is not None))
+
+    return candidates
+
+def get_codec(config):
+    """
+    Choose how to encode recordings from config.codec, config.encoder_speed and config.hw_encoder,
+    or from config.fourcc and config.file_format when config.codec is empty.
+
+    Each option is tried by encoding a couple of frames, and MJPEG is used when none of them work with this build of OpenCV or ffmpeg.
+    The choice is made once per process for each combination of these keys.
+    Returns a dict with the file_format to save as, for open_video_writer().
+    """
+    key = tuple(config.get(k) for k in ['codec', 'encoder_speed', 'hw_encoder', 'fourcc', 'file_format'])
+
+    with _codecs_lock:
+        if key not in _codecs:
+            _codecs[key] = __choose_codec(config)
+
+        return _codecs[key]
+
+def __choose_codec(config):
+    candidates = __get_candidates(config)
+
+    for codec in candidates:
+        if __can_encode(codec):
+            utility.info('Recording video with {}.'.format(codec['name']))
+            return codec
+
+        utility.warn('Cannot record video with {} here.'.format(codec['name']))
+
+    codec = dict(CODECS[FALLBACK_CODEC], name=FALLBACK_CODEC, encoder_args=None, hw_acceleration=False)
+
+    # the recordings change file format, which users and the web UI will notice
+    utility.warn('Recording video with {} (.{}) instead of the requested {} (.{}).'.format(
+        codec['name'], codec['file_format'], candidates[0]['name'], candidates[0]['file_format']
+    ))
+
+    return codec
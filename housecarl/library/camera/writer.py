@@ -1,61 +1,144 @@
 import os
-import cv2
-import time
-from queue import Queue
-from threading import Thread
-from collections import deque
 from datetime import datetime
 
-from housecarl.library.common import utility
+from housecarl.library.common import utility, metrics
+from housecarl.library.camera import frame_pool, video_codecs, encoder_pool
+from housecarl.library.camera.pre_roll import PreRollBuffer
+from housecarl.library.camera import stream_recorder
+from housecarl.library.camera.stream_recorder import StreamRecorder
+from housecarl.library.camera.continuous_recorder import ContinuousRecorder
+from housecarl.library.camera.event_index import EventIndex
+
+WRITER_MODES = ['encode', 'copy']
 
 # https://www.pyimagesearch.com/2016/02/29/saving-key-event-video-clips-with-opencv/
 class Writer:
-    def __init__(self, config) -> None:
+    def __init__(self, config, name=None, src=None) -> None:
+        """
+        name is an optional camera name, added to recording filenames so cameras don't overwrite each other.
+
+        src is the camera's video source. With config.mode "copy" and a stream url, the camera's compressed stream
+        is recorded as it is, instead of encoding the decoded frames.
+
+        With config.continuous, every frame is recorded into fixed length segments, and a recording only marks where
+        an event starts and ends in them. Events are added to the EventIndex in out_dir when config.event_index is set.
+        """
         self.config = config
+        self.name = name
         config.set('out_dir', utility.get_video_dir(config.get('out_dir')))
 
-        self.__Q = None
-        self.__writer = None
-        self.__thread = None
+        self.__stream = None
+        self.__streams = []
+        self.__num_dropped = 0
         self.__recording = False
         self.__last_recording_path = None
-        self.__frames = deque(maxlen=config.get('buffer_size'))
-        self.__fourcc = cv2.VideoWriter_fourcc(*self.config.get('fourcc'))
-        
+        self.__base_recording_path = None
+        self.__recent_recording_paths = set()
+        self.__frame_shape = None
+        self.__stream_recorder = None
+        self.__codec = None
+        self.__pre_roll = None
+        self.__continuous = None
+        self.__event = None
+        self.__event_index = EventIndex(config.get('out_dir')) if config.get('event_index') else None
+
+        if config.get('continuous'):
+            if config.get('mode') == 'copy':
+                utility.warn('config.writer.mode "copy" is not supported with config.writer.continuous. Encoding frames instead.')
+
+            self.__continuous = ContinuousRecorder(config, video_codecs.get_codec(config), name=name)
+            return
+
+        if self.__should_copy_stream(src):
+            self.__stream_recorder = StreamRecorder(
+                src,
+                os.path.join(config.get('out_dir'), '.segments', utility.slugify(name or 'default')),
+                segment_seconds=config.get('segment_seconds'),
+                buffer_seconds=self.__get_buffer_seconds(),
+                name=name
+            )
+
+            return
+
+        self.__codec = video_codecs.get_codec(config)
+        self.__pre_roll = PreRollBuffer(
+            self.__get_buffer_seconds(),
+            buffer_format=config.get('buffer_format'),
+            quality=config.get('buffer_quality'),
+            name=name
+        )
+
+    def __should_copy_stream(self, src):
+        mode = self.config.get('mode')
+
+        if mode not in WRITER_MODES:
+            raise Exception('config.writer.mode must be one of {}.'.format(WRITER_MODES))
+
+        if mode != 'copy':
+            return False
+
+        # fall back to encoding the decoded frames
+        if not stream_recorder.is_stream_source(src):
+            utility.warn('config.writer.mode "copy" needs a stream url. Encoding frames from {} instead.'.format(src))
+            return False
+
+        if not stream_recorder.is_ffmpeg_installed():
+            utility.warn('config.writer.mode "copy" needs ffmpeg. Encoding frames instead.')
+            return False
+
+        return True
+
+    def __get_buffer_seconds(self):
+        # buffer_size is the older, frame based setting, used while buffer_seconds is left at 0.0
+        return self.config.get('buffer_seconds') or self.config.get('buffer_size') / self.config.get('fps')
+
     def __start(self, output_path):
         self.__recording = True
-        (frame_height, frame_width) = self.__frames[0].shape[:2]
+        (frame_height, frame_width) = self.__frame_shape[:2]
         dimensions = (frame_width, frame_height)
-        self.__writer = cv2.VideoWriter(output_path, self.__fourcc, self.config.get('fps'), dimensions, True)
-        self.__Q = Queue()
+        writer = video_codecs.open_video_writer(output_path, self.__codec, self.config.get('fps'), dimensions)
 
-        # add all frames in the deque to the queue
-        [self.__Q.put(self.__frames[i - 1]) for i in range(len(self.__frames), 0, -1)]
+        # each recording has its own stream in the shared encoder pool, so a new recording can start while the last one drains
+        pool = encoder_pool.get_pool(self.config.get('encoder_threads'))
+        stream = pool.open_stream(
+            lambda item: self.__write_item(writer, stream, item),
+            lambda: self.__save(writer, output_path)
+        )
 
-        # start a thread to write frames to the vide file
-        self.__thread = Thread(target=self.__write, args=())
-        self.__thread.daemon = True
-        self.__thread.start()
+        # the pre-roll is queued as one item, as it may be longer than the queue
+        pre_roll = self.__pre_roll.drain()
+        stream.put(pre_roll)
 
-    def __write(self):
-        while True:
-            # terminate the thread when we are no longer recording
-            if not self.__recording:
-                return
+        self.__stream = stream
+        self.__streams = [s for s in self.__streams if not s.is_done()] + [stream]
 
-            # if we have frames in the queue, write them
-            if not self.__Q.empty():
-                frame = self.__Q.get()
-                self.__writer.write(frame)
-            else:
-                # if we have no frames to write, sleep so we don't waste CPU cycles
-                time.sleep(self.config.get('timeout'))
+        # the event starts after the pre-roll
+        self.__event = {'started_at': datetime.now().timestamp(), 'start_video': output_path, 'start_offset': len(pre_roll) / self.config.get('fps')}
+
+    def __add_event(self, event):
+        if self.__event_index is not None:
+            self.__event_index.add_event(camera=self.name or 'default', **event)
+
+    def __write_item(self, writer, stream, item):
+        # the pre-roll is decompressed as it is written
+        items = item if isinstance(item, list) else [item]
 
-    def __flush(self):
-        # write all remaining frames to the file
-        while not self.__Q.empty():
-            frame = self.__Q.get()
-            self.__writer.write(frame)
+        for item in items:
+            with metrics.timer('write', camera=self.name or 'default'):
+                writer.write(PreRollBuffer.decode(item))
+
+            frame_pool.release(item)
+
+        metrics.set_gauge('writer_queue_depth', stream.qsize(), camera=self.name or 'default')
+
+    def __save(self, writer, output_path):
+        error = writer.release()
+
+        if error:
+            utility.error('Could not save the recording to {}: {}'.format(output_path, error))
+            return
+
+        utility.info('Recording saved to {}'.format(output_path))
 
     def is_recording(self):
         return self.__recording
@@ -67,28 +150,118 @@ class Writer:
             utility.error('Remaining disk space is too small to record video: {} < {}'.format(free_disk_space, min_disk_space))
             return
 
+        if self.__frame_shape is None and self.__stream_recorder is None:
+            utility.error('Cannot start a recording before the first frame.')
+            return
+
+        if self.__continuous and not self.is_recording():
+            event = {'started_at': datetime.now().timestamp()}
+            self.__event = event
+            self.__recording = True
+
+            # the position is filled in once the frames before it have been written
+            self.__continuous.mark(lambda path, offset: event.update(start_video=path, start_offset=offset))
+            return
+
         if not self.is_recording():
             timestamp = datetime.now()
             date = timestamp.strftime("%Y-%m-%d")
             time = timestamp.strftime("%Hh%Mm%Ss")
             date_dir = os.path.join(self.config.get('out_dir'), date)
             utility.ensure_dir(date_dir)
-            filename = '{}_{}.{}'.format(date, time, self.config.get('file_format'))
+            file_format = self.config.get('copy_format') if self.__stream_recorder else self.__codec['file_format']
+            filename = '{}_{}.{}'.format(date, time, file_format)
+
+            if self.name:
+                filename = '{}_{}'.format(utility.slugify(self.name), filename)
+
+            # recordings started within the same second would share a name. a recording's file may not exist
+            # until ffmpeg opens it, or the stream recorder joins its segments, so this second's paths are kept too
             filepath = os.path.join(date_dir, filename)
+            if filepath != self.__base_recording_path:
+                self.__base_recording_path = filepath
+                self.__recent_recording_paths = set()
+
+            filepath = utility.get_unique_path(filepath, self.__recent_recording_paths)
+            self.__recent_recording_paths.add(filepath)
             self.__last_recording_path = filepath
-            self.__start(filepath)
+
+            if self.__stream_recorder:
+                self.__recording = True
+                self.__stream_recorder.start(filepath)
+
+                # the pre-roll is cut on segment boundaries, so the exact start isn't known
+                self.__event = {'started_at': datetime.now().timestamp(), 'start_video': filepath, 'start_offset': None}
+            else:
+                self.__start(filepath)
 
     def update(self, frame):
-        # update the frames buffer
-        self.__frames.appendleft(frame)
+        self.__frame_shape = frame.shape
+
+        if self.__continuous:
+            self.__continuous.update(frame)
+            return
+
+        # the stream recorder doesn't need decoded frames
+        if self.__stream_recorder:
+            return
+
+        # update the pre-roll buffer
+        self.__pre_roll.add(frame)
 
         # if we're recording, put the frame in the queue
         if self.__recording:
-            self.__Q.put(frame)
+            # when the encoder can't keep up, drop frames from the recording rather than stall the capture loop
+            if self.__stream.qsize() >= self.config.get('queue_size'):
+                self.__num_dropped += 1
+                metrics.set_gauge('writer_dropped_frames', self.__num_dropped, camera=self.name or 'default')
+                return
 
-    def finish(self):
+            self.__stream.put(frame_pool.retain(frame))
+            metrics.set_gauge('writer_queue_depth', self.__stream.qsize(), camera=self.name or 'default')
+
+    def finish(self, label=None, confidence=None):
+        """
+        End the recording. label and confidence describe the event, for the event index.
+        """
+        event = self.__event
+        self.__event = None
         self.__recording = False
-        self.__thread.join()
-        self.__flush()
-        self.__writer.release()
-        utility.info('Recording saved to {}'.format(self.__last_recording_path))
+
+        if event is not None:
+            event.update(ended_at=datetime.now().timestamp(), label=label, confidence=confidence)
+
+        if self.__continuous:
+            if event is not None:
+                self.__continuous.mark(lambda path, offset: self.__add_event(dict(event, end_video=path, end_offset=offset)))
+
+            return
+
+        if self.__stream_recorder:
+            # the recording is joined in the background once its last segment is complete
+            self.__stream_recorder.finish()
+        else:
+            # the encoder pool drains the stream and saves the file in the background
+            self.__stream.close()
+
+        # a clip ends with its last frame
+        if event is not None:
+            self.__add_event(dict(event, end_video=event['start_video'], end_offset=None))
+
+    def close(self):
+        """
+        Finish any recording and wait for every recording to be saved.
+        """
+        if self.is_recording():
+            self.finish()
+
+        [stream.join() for stream in self.__streams]
+
+        if self.__stream_recorder:
+            self.__stream_recorder.stop()
+
+        if self.__continuous:
+            self.__continuous.stop()
+
+        if self.__event_index is not None:
+            self.__event_index.close()
@@ -12,6 +12,8 @@ models_path = join(root_path, 'models')
 mobilenet_path = join(models_path, 'mobilenet')
 coral_path = join(models_path, 'coral')
 yolo_path = join(models_path, 'yolo')
+onnx_path = join(models_path, 'onnx')
+model_cache_path = join(models_path, 'cache')
 
 edge_tpu_path = join(root_path, 'edgetpu_runtime')
 
@@ -0,0 +1,159 @@
+from time import time
+from threading import Lock
+from collections import deque
+from contextlib import contextmanager
+
+# histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# number of recent observations kept per histogram for percentiles
+NUM_SAMPLES = 2048
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=NUM_SAMPLES)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def percentile(self, q):
+        """
+        Percentile q in [0, 100] of the recent observations.
+        """
+        if not self.samples:
+            return None
+
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+
+        return ordered[index]
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+
+    if not pairs:
+        return ''
+
+    escaped = ['{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs]
+
+    return '{' + ','.join(escaped) + '}'
+
+_lock = Lock()
+_histograms = {}
+_gauges = {}
+
+# observations kept for take_observations(), or None when they aren't being kept
+_observations = None
+
+def observe(stage, seconds, **labels):
+    """
+    Record how long a pipeline stage took, e.g. observe('inference', 0.12, model='yolo').
+    """
+    key = (stage, _label_key(labels))
+
+    with _lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram()
+
+        _histograms[key].observe(seconds)
+
+        if _observations is not None:
+            _observations.append((stage, seconds, labels))
+
+def record_observations():
+    """
+    Also keep every observation until take_observations(), so a worker process can send its timings to the parent.
+    """
+    global _observations
+
+    with _lock:
+        _observations = []
+
+def take_observations():
+    """
+    Return a list of (stage, seconds, labels) observed since the last call, and forget them.
+    """
+    global _observations
+
+    with _lock:
+        if _observations is None:
+            return []
+
+        (observations, _observations) = (_observations, [])
+
+    return observations
+
+@contextmanager
+def timer(stage, **labels):
+    """
+    Time the body of a with block as a pipeline stage.
+    """
+    started_at = time()
+
+    try:
+        yield
+    finally:
+        observe(stage, time() - started_at, **labels)
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[(name, _label_key(labels))] = value
+
+def get_histogram(stage, **labels):
+    return _histograms.get((stage, _label_key(labels)))
+
+def get_histograms():
+    """
+    Return a list of (stage, labels, histogram) for every recorded stage.
+    """
+    with _lock:
+        return [(stage, dict(label_key), histogram) for (stage, label_key), histogram in _histograms.items()]
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _gauges.clear()
+
+def to_prometheus():
+    """
+    Render every metric in the Prometheus text exposition format.
+    """
+    lines = [
+        '# HELP housecarl_stage_seconds Time spent in each stage of the video pipeline.',
+        '# TYPE housecarl_stage_seconds histogram'
+    ]
+
+    with _lock:
+        for (stage, label_key), histogram in sorted(_histograms.items()):
+            stage_key = (('stage', stage),) + label_key
+
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append('housecarl_stage_seconds_bucket{} {}'.format(_format_labels(stage_key, [('le', str(bound))]), count))
+
+            lines.append('housecarl_stage_seconds_bucket{} {}'.format(_format_labels(stage_key, [('le', '+Inf')]), histogram.count))
+            lines.append('housecarl_stage_seconds_sum{} {}'.format(_format_labels(stage_key), histogram.sum))
+            lines.append('housecarl_stage_seconds_count{} {}'.format(_format_labels(stage_key), histogram.count))
+
+        gauge_names = sorted(set(name for (name, label_key) in _gauges.keys()))
+
+        for name in gauge_names:
+            lines.append('# TYPE housecarl_{} gauge'.format(name))
+
+            for (gauge_name, label_key), value in sorted(_gauges.items()):
+                if gauge_name == name:
+                    lines.append('housecarl_{}{} {}'.format(name, _format_labels(label_key), value))
+
+    return '\n'.join(lines) + '\n'
@@ -1,4 +1,5 @@
 import os
+import re
 import sys
 import json
 import shutil
@@ -48,6 +49,22 @@ def get_precision(num: float, num_dec: int =3) -> float:
 
     return prec
 
+def get_iou(box_a, box_b):
+    """
+    Intersection over union of two (x1, y1, x2, y2) boxes.
+    """
+    x1, y1 = max(box_a[0], box_b[0]), max(box_a[1], box_b[1])
+    x2, y2 = min(box_a[2], box_b[2]), min(box_a[3], box_b[3])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+    area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+    union = area_a + area_b - intersection
+
+    return intersection / union if union > 0 else 0
+
+def slugify(text: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', str(text).lower()).strip('-')
+
 def bytes_to_gb(num_bytes):
     return num_bytes / 1000000000
 
@@ -57,12 +74,36 @@ def get_free_space():
 
     return bytes_to_gb(free)
 
+def get_unique_path(path, taken=()):
+    """
+    Return path, or path with a numeric suffix before its extension if it already exists or is in taken.
+    """
+    (root, ext) = os.path.splitext(path)
+    unique_path = path
+    suffix = 1
+
+    while os.path.exists(unique_path) or unique_path in taken:
+        unique_path = '{}_{}{}'.format(root, suffix, ext)
+        suffix += 1
+
+    return unique_path
+
 def copy_file(src_path, dest_path):
     shutil.copyfile(src_path, dest_path)
 
 def get_typename(obj):
     return type(obj).__name__
 
+def coerce_type(value, expected_type):
+    """
+    Return value as expected_type if it can be without losing anything, i.e. an int where a float is expected.
+    Otherwise value is returned as it is.
+    """
+    if expected_type == 'float' and get_typename(value) == 'int':
+        return float(value)
+
+    return value
+
 def set_properties(properties: dict, destination) -> None:
     for key, value in properties.items():
         setattr(destination, key, value)
@@ -1 +1,5 @@
 from housecarl.library.detectors.get_detector import Detector
+from housecarl.library.detectors.motion_gate import MotionGate
+from housecarl.library.detectors.scheduler import InferenceScheduler
+from housecarl.library.detectors.roi import Roi
+from housecarl.library.detectors.tracker import Tracker
@@ -1,29 +1,48 @@
+import cv2
 import numpy as np
-from threading import Thread
-from multiprocessing import Queue
+from time import time
+from queue import Queue
+from threading import Thread, Lock
 
-from housecarl.library.common import utility
+from housecarl.library.common import utility, metrics
+from housecarl.library.camera import frame_pool
 from housecarl.library.camera.image import draw_detection
 
+# frames are resized to the model's input, so any size works for warming up
+WARM_UP_SHAPE = (480, 640, 3)
+
 class BaseDetector:
     def __init__(self, config):
         self.__config = config
         self.__verify_child()
         self._set_valid_classes()
         self._set_colors()
+        self._set_class_lookups()
+
+        # a single detector is shared by every camera, so the net must only run one frame at a time
+        self.__inference_lock = Lock()
+
+        # seconds the last inference took for each stream, for the InferenceScheduler
+        self.__latencies = {}
+
+        # preprocessing buffers are reused across frames
+        self.__blobs = {}
+        self.__resized = None
 
         if self.config.get('threaded'):
-            self.__inputQueue = Queue(maxsize=1)
-            self.__outputQueue = Queue(maxsize=1)
+            # each stream gets its own single slot input and output queues
+            self.__streams_lock = Lock()
+            self.__inputQueues = {}
+            self.__outputQueues = {}
+
+            # use [] instead of None for identifiability
+            self.__last_detections = {}
 
             self.__thread_active = True
             t = Thread(target=self._handle_input_queue, args=())
             t.daemon = True
             t.start()
 
-            # use [] instead of None for identifiability
-            self.__last_detections = []
-
     @staticmethod
     def alert_missing(cls):
         utility.warn('Requested class "{}" does not exist in set of all classes.'.format(cls))
@@ -44,78 +63,238 @@ class BaseDetector:
     def _set_colors(self):
         self.__colors = np.random.uniform(0, 255, size=(len(self.__valid_classes), 3))
 
+    def _set_class_lookups(self):
+        """
+        Precompute everything needed per detection, indexed by the model's class index,
+        so filtering a detection is an array lookup instead of a list search.
+        """
+        is_dict = utility.get_typename(self.__all_classes) == 'dict'
+        class_indices = list(self.__all_classes.keys()) if is_dict else list(range(len(self.__all_classes)))
+        num_indices = max(class_indices) + 1 if class_indices else 0
+
+        self.__label_indices = {label: i for i, label in enumerate(self.__valid_classes)}
+        self.__class_mask = np.zeros(num_indices, dtype=bool)
+        self.__class_colors = [None] * num_indices
+
+        for class_index in class_indices:
+            label = self.__all_classes[class_index]
+
+            if label in self.__label_indices:
+                self.__class_mask[class_index] = True
+                self.__class_colors[class_index] = self.__colors[self.__label_indices[label]]
+
+    def get_class_mask(self):
+        """
+        A bool array that is True at the index of every class we want, for decoders to drop the others before building detections.
+        """
+        return self.__class_mask
+
+    def get_min_confidence(self):
+        return self.config.get('min_confidence')
+
+    def __register_stream(self, stream):
+        with self.__streams_lock:
+            if stream not in self.__inputQueues:
+                self.__inputQueues[stream] = Queue(maxsize=1)
+                self.__outputQueues[stream] = Queue(maxsize=1)
+                self.__last_detections[stream] = []
+
     def _handle_input_queue(self):
+        batch_size = max(1, self.config.get('batch_size') or 1)
+
         while self.__thread_active:
-            # check to see if there is a frame in the input queue
-            if not self.__inputQueue.empty():
-                # grab the frame, run the detection, and add it to the queue
-                frame = self.__inputQueue.get()
+            with self.__streams_lock:
+                streams = list(self.__inputQueues.keys())
+
+            # check to see which streams have a frame in their input queue
+            pending = [stream for stream in streams if not self.__inputQueues[stream].empty()]
+
+            # grab the latest frame from up to batch_size streams and run them through the net together
+            for i in range(0, len(pending), batch_size):
+                batch_streams = pending[i:i + batch_size]
+                (frames, rois) = zip(*[self.__inputQueues[stream].get() for stream in batch_streams])
+
+                started_at = time()
+                detections_batch = self.get_valid_detections_batch(frames, rois)
+
+                # every frame in the batch waited for the whole batch
+                latency = time() - started_at
+                self.__latencies.update({stream: latency for stream in batch_streams})
+
+                [frame_pool.release(frame) for frame in frames]
 
-                detections = self.get_valid_detections(frame)
-                self.__outputQueue.put(detections)
+                for stream, detections in zip(batch_streams, detections_batch):
+                    self.__outputQueues[stream].put(detections)
+
+    def _process_frame_in_thread(self, frame, on_detections=None, stream=0, roi=None, draw=True):
+        self.__register_stream(stream)
+
+        input_queue = self.__inputQueues[stream]
+        output_queue = self.__outputQueues[stream]
 
-    def _process_frame_in_thread(self, frame, on_detections=None):
         # only put in new frames when we are ready to process them
-        if self.__inputQueue.empty():
-            self.__inputQueue.put(frame)
+        # the detection thread holds on to the frame, so it must be retained until it has been processed
+        if input_queue.empty():
+            input_queue.put((frame_pool.retain(frame), roi))
 
-        if not self.__outputQueue.empty():
-            self.__last_detections = self.__outputQueue.get()
+        if not output_queue.empty():
+            self.__last_detections[stream] = output_queue.get()
 
-        if self.config.get('show_detections') and self.__last_detections:
-            self.draw_detections(frame, self.__last_detections)
+        last_detections = self.__last_detections[stream]
+
+        if draw and self.config.get('show_detections') and last_detections:
+            self.draw_detections(frame, last_detections)
         
         if on_detections:
-            args = (self.__last_detections) if utility.num_args(on_detections) == 1 else (self.__last_detections, frame)
+            args = (last_detections) if utility.num_args(on_detections) == 1 else (last_detections, frame)
             on_detections(*args)
 
-    def _process_frame_without_thread(self, frame, on_detections=None):
-        detections = self.get_valid_detections(frame)
-        if self.config.get('show_detections'):
+    def _process_frame_without_thread(self, frame, on_detections=None, stream=0, roi=None, draw=True):
+        started_at = time()
+        detections = self.get_valid_detections(frame, roi)
+        self.__latencies[stream] = time() - started_at
+        if draw and self.config.get('show_detections'):
             self.draw_detections(frame, detections)
         
         if on_detections:
             args = (detections) if utility.num_args(on_detections) == 1 else (detections, frame)
             on_detections(*args)
 
+    def _get_blob(self, frames, size, dtype=np.uint8, scale=None, swap_rb=False):
+        """
+        Like cv2.dnn.blobFromImages without mean subtraction or cropping, but frames are resized
+        and packed into buffers that are reused, so no memory is allocated per frame.
+
+        The blob is only valid until the next call, so it must be handed to the net straight away.
+        """
+        (width, height) = size
+        key = (len(frames), width, height, np.dtype(dtype).str)
+
+        if key not in self.__blobs:
+            self.__blobs[key] = np.empty((len(frames), 3, height, width), dtype=dtype)
+
+        if self.__resized is None or self.__resized.shape[:2] != (height, width):
+            self.__resized = np.empty((height, width, 3), dtype=np.uint8)
+
+        blob = self.__blobs[key]
+
+        for i, frame in enumerate(frames):
+            resized = frame if frame.shape[:2] == (height, width) else cv2.resize(frame, size, dst=self.__resized)
+            channels = (resized[:, :, ::-1] if swap_rb else resized).transpose(2, 0, 1)
+
+            if scale is None:
+                np.copyto(blob[i], channels, casting='unsafe')
+            else:
+                np.multiply(channels, scale, out=blob[i], dtype=dtype, casting='unsafe')
+
+        return blob
+
     def set_all_classes(self, classes):
         self.__all_classes = classes
 
     def class_is_valid(self, label):
-        return label in self.__valid_classes
+        return label in self.__label_indices
 
     def get_class_index(self, label):
-        return self.__valid_classes.index(label)
+        return self.__label_indices[label]
 
     def get_label_color(self, label):
         return self.__colors[self.get_class_index(label)]
 
     def filter_and_hydrate_normalized_detections(self, detections):
+        # decoders that use get_class_mask have already dropped most of these, so this is only a final check
         filtered_detections = []
+        min_confidence = self.config.get('min_confidence')
+        num_indices = len(self.__class_mask)
 
         for (class_index, confidence, box) in detections:
-            if confidence > self.config.get('min_confidence'):
-                label = self.__all_classes[class_index]
-                if self.class_is_valid(label):
-                    color = self.get_label_color(label)
-                    detection = (label, confidence, box, color)
-                    filtered_detections.append(detection)
+            class_index = int(class_index)
+
+            if confidence > min_confidence and 0 <= class_index < num_indices and self.__class_mask[class_index]:
+                detection = (self.__all_classes[class_index], confidence, box, self.__class_colors[class_index])
+                filtered_detections.append(detection)
 
         return filtered_detections
 
-    def get_valid_detections(self, frame):
+    def _get_normalized_detections_in_rois(self, frames, rois):
+        """
+        Crop every frame to its roi and run all of the tiles through the net in a single batch,
+        mapping their boxes back to the frame. Frames without a roi are run whole.
+        """
+        tiles = []
+        tile_counts = []
+
+        for frame, roi in zip(frames, rois):
+            frame_tiles = roi.crop(frame) if roi else [frame]
+            tiles += frame_tiles
+            tile_counts.append(len(frame_tiles))
+
+        if len(tiles) == 1:
+            all_detections_batch = [self._get_normalized_detections(tiles[0])]
+        else:
+            all_detections_batch = self._get_normalized_detections_batch(tiles)
+
+        normalized_detections_batch = []
+        start = 0
+
+        for frame, roi, count in zip(frames, rois, tile_counts):
+            detections_per_tile = all_detections_batch[start:start + count]
+            start += count
+
+            if roi:
+                normalized_detections_batch.append(roi.map_detections(detections_per_tile, frame.shape))
+            else:
+                normalized_detections_batch.append(detections_per_tile[0])
+
+        return normalized_detections_batch
+
+    def get_valid_detections(self, frame, roi=None):
         # self._get_normalized_detections must be provided by the inheriting class
         detections = None
 
         try:
-            all_detections = self._get_normalized_detections(frame)
-            detections = self.filter_and_hydrate_normalized_detections(all_detections)
+            with self.__inference_lock:
+                if roi:
+                    all_detections = self._get_normalized_detections_in_rois([frame], [roi])[0]
+                else:
+                    all_detections = self._get_normalized_detections(frame)
+
+            with metrics.timer('filter', model=self.config.get('model')):
+                detections = self.filter_and_hydrate_normalized_detections(all_detections)
         except Exception as e:
             utility.error('error running inference\n', e)
         # return [] instead of None so we can determine
         # if the detections are new or old (threaded)
         return detections if detections else []
 
+    def _get_normalized_detections_batch(self, frames):
+        # children that support batched inference should override this with a single forward pass
+        return [self._get_normalized_detections(frame) for frame in frames]
+
+    def get_valid_detections_batch(self, frames, rois=None):
+        """
+        Run detections on several frames at once, returning a list of detections for each frame.
+        rois has a Roi or None for each frame.
+        """
+        detections_batch = None
+
+        try:
+            with self.__inference_lock:
+                if rois and any(rois):
+                    all_detections_batch = self._get_normalized_detections_in_rois(frames, rois)
+                else:
+                    all_detections_batch = self._get_normalized_detections_batch(frames)
+
+            with metrics.timer('filter', model=self.config.get('model')):
+                detections_batch = [self.filter_and_hydrate_normalized_detections(d) for d in all_detections_batch]
+        except Exception as e:
+            utility.error('error running batched inference\n', e)
+
+        if not detections_batch:
+            return [[] for frame in frames]
+
+        return [detections if detections else [] for detections in detections_batch]
+
     def draw_detections(self, frame, detections):
         for detection in detections:
             draw_detection(frame, detection)
@@ -124,11 +303,40 @@ class BaseDetector:
         detections = self.get_valid_detections(frame)
         self.draw_detections(frame, detections)
 
+    def warm_up(self, background=True):
+        """
+        Run a blank frame through the net, so the first real frame doesn't pay for allocating buffers
+        and picking kernels. With background=True this happens in a thread while the cameras connect.
+        """
+        def run():
+            with self.__inference_lock:
+                self._get_normalized_detections(np.zeros(WARM_UP_SHAPE, dtype=np.uint8))
+
+        if not background:
+            return run()
+
+        t = Thread(target=run, args=())
+        t.daemon = True
+        t.start()
+
     def terminate_thread(self):
         self.__thread_active = False
 
-    def process_frame(self, frame, on_detections=None):
+    def get_inference_latency(self, stream=0):
+        """
+        Seconds the last inference on a frame of stream took, or None before the first one.
+        """
+        return self.__latencies.get(stream)
+
+    def process_frame(self, frame, on_detections=None, stream=0, roi=None, draw=True):
+        """
+        Run detections on a frame and pass them to on_detections.
+
+        stream identifies the camera the frame came from so that a single detector can be shared by several cameras.
+        roi is an optional Roi of that camera, to crop and tile the frame before inference.
+        draw is False when a later stage draws the detections instead.
+        """
         if self.config.get('threaded'):
-            self._process_frame_in_thread(frame, on_detections)
+            self._process_frame_in_thread(frame, on_detections, stream, roi, draw)
         else:
-            self._process_frame_without_thread(frame, on_detections)
+            self._process_frame_without_thread(frame, on_detections, stream, roi, draw)
@@ -1,32 +1,40 @@
 import os
-import cv2
 import numpy as np
 
 from housecarl.library.setup import coral
-from housecarl.library.common import constants, utility
+from housecarl.library.common import constants, utility, metrics
 from housecarl.library.detectors.base_detector import BaseDetector
+from housecarl.library.detectors.coral_pipeline import CoralPipeline
 
 try:
     from pycoral.adapters.common import input_size
     from pycoral.adapters.detect import get_objects
     from pycoral.utils.dataset import read_label_file
-    from pycoral.utils.edgetpu import make_interpreter
+    from pycoral.utils.edgetpu import make_interpreter, list_edge_tpus
     from pycoral.utils.edgetpu import run_inference
 except Exception as e:
     pass
 
 class CoralDetector(BaseDetector):
     def __init__(self, config):
+        """
+        Run the SSD MobileNet v2 EdgeTPU model on one or more Coral devices.
+
+        config must contain the following keys, in addition to those used by the BaseDetector:
+            coral_devices: int - number of EdgeTPUs to use. 0 uses every device found.
+
+        Frames are pipelined across the devices, so batches from several cameras (see batch_size) scale with the number of TPUs.
+        """
         coral.verify_lib_edge_tpu_install()
         coral.verify_pycoral_install()
 
         self.__labels_path = os.path.join(constants.coral_path, 'coco_labels.txt')
         self.__model_path = os.path.join(constants.coral_path, 'ssd_mobilenet_v2_coco_quant_postprocess_edgetpu.tflite')
         
-        self.__set_all_classes()
-        self.__init_interpreter()
-        
         self.config = config
+        self.__set_all_classes()
+        self.__init_pipeline()
+
         super().__init__(config)
 
     def __set_all_classes(self):
@@ -52,19 +60,34 @@ class CoralDetector(BaseDetector):
         if not os.path.exists(self.__labels_path):
             utility.download_file(label_url, self.__labels_path)
 
-    def __init_interpreter(self):
-        self.interpreter = make_interpreter(self.__model_path)
-        self.interpreter.allocate_tensors()
-        self.inference_size = input_size(self.interpreter)
+    def __get_devices(self):
+        num_found = len(list_edge_tpus())
+        num_wanted = self.config.get('coral_devices') or num_found
+
+        if num_wanted > num_found:
+            utility.warn('config.detector.coral_devices is {}, but only {} EdgeTPUs were found.'.format(num_wanted, num_found))
+
+        # with no devices listed, let make_interpreter pick the default device as before
+        return [':{}'.format(i) for i in range(min(num_wanted, num_found))] or [None]
+
+    def __make_interpreter(self, device):
+        interpreter = make_interpreter(self.__model_path) if device is None else make_interpreter(self.__model_path, device=device)
+        interpreter.allocate_tensors()
 
+        return interpreter
 
-    def __get_raw_detections(self, frame):
-        cv2_im_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        cv2_im_rgb = cv2.resize(cv2_im_rgb, self.inference_size)
-        run_inference(self.interpreter, cv2_im_rgb.tobytes())
-        raw_detections = get_objects(self.interpreter, self.min_confidence)
+    def __invoke(self, interpreter, input_bytes):
+        run_inference(interpreter, input_bytes)
 
-        return raw_detections
+        return get_objects(interpreter, self.config.get('min_confidence'))
+
+    def __init_pipeline(self):
+        interpreters = [self.__make_interpreter(device) for device in self.__get_devices()]
+        self.inference_size = input_size(interpreters[0])
+
+        utility.info('Running the coral model on {} EdgeTPU{}.'.format(len(interpreters), 's' if len(interpreters) > 1 else ''))
+
+        self.__pipeline = CoralPipeline(interpreters, self.inference_size, self.__invoke)
 
     def __normalize_detections(self, raw_detections, frame):
         normalized_detections = []
@@ -73,6 +96,10 @@ class CoralDetector(BaseDetector):
         scale_x = W / self.inference_size[0]
         scale_y = H / self.inference_size[1]
 
+        # get_objects has already applied min_confidence, so only unwanted classes are left to drop
+        class_mask = self.get_class_mask()
+        raw_detections = [d for d in raw_detections if 0 <= d.id < len(class_mask) and class_mask[d.id]]
+
         for detection in raw_detections:
             bbox = detection.bbox.scale(scale_x, scale_y)
             confidence = detection.score
@@ -85,7 +112,23 @@ class CoralDetector(BaseDetector):
 
     def _get_normalized_detections(self, frame):
         # must be provided to the BaseDetector
-        raw_detections = self.__get_raw_detections(frame)
-        normalized_detections = self.__normalize_detections(raw_detections, frame)
+        raw_detections = self.__pipeline.run([frame])[0]
+
+        with metrics.timer('postprocess', model='coral'):
+            normalized_detections = self.__normalize_detections(raw_detections, frame)
 
         return normalized_detections
+
+    def _get_normalized_detections_batch(self, frames):
+        # may be provided to the BaseDetector
+        raw_detections_batch = self.__pipeline.run(frames)
+
+        with metrics.timer('postprocess', model='coral'):
+            return [
+                self.__normalize_detections(raw_detections, frame)
+                for raw_detections, frame in zip(raw_detections_batch, frames)
+            ]
+
+    def terminate_thread(self):
+        super().terminate_thread()
+        self.__pipeline.stop()
@@ -0,0 +1,112 @@
+import cv2
+from queue import Queue
+from threading import Thread
+
+from housecarl.library.common import utility, metrics
+
+# frames waiting on each device, so a device always has its next input ready when it finishes
+DEVICE_QUEUE_SIZE = 2
+
+class CoralPipeline:
+    def __init__(self, interpreters, inference_size, invoke):
+        """
+        Run frames through several interpreters at once, with preprocessing on the CPU overlapped with inference.
+
+        A preprocessing thread converts and resizes each frame, then hands it to the devices round robin.
+        Each interpreter has its own thread, so every EdgeTPU works on a different frame at the same time.
+
+        interpreters is a list of interpreters, one per device.
+        inference_size is the (width, height) the model expects.
+        invoke is a function of (interpreter, input_bytes) that runs inference and returns the raw detections.
+        It is the only thing that touches an interpreter, so a fake interpreter and invoke can stand in for a TPU.
+        """
+        self.__interpreters = interpreters
+        self.__inference_size = tuple(inference_size)
+        self.__invoke = invoke
+
+        self.__preprocess_queue = Queue()
+        self.__device_queues = [Queue(maxsize=DEVICE_QUEUE_SIZE) for interpreter in interpreters]
+        self.__next_device = 0
+
+        threads = [Thread(target=self.__preprocess, args=())]
+        threads += [Thread(target=self.__infer, args=(device,)) for device in range(len(interpreters))]
+
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+    def num_devices(self):
+        return len(self.__interpreters)
+
+    def __preprocess(self):
+        while True:
+            task = self.__preprocess_queue.get()
+
+            # None is the shutdown sentinel
+            if task is None:
+                [device_queue.put(None) for device_queue in self.__device_queues]
+                break
+
+            (index, frame, results) = task
+
+            # a frame that can't be preprocessed has no detections, and mustn't stop the frames behind it
+            try:
+                with metrics.timer('preprocess', model='coral'):
+                    # resizing first converts fewer pixels, and gives the same result as converting first
+                    resized = cv2.resize(frame, self.__inference_size)
+                    input_bytes = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB).tobytes()
+            except Exception as e:
+                utility.error('Could not preprocess frame for the Coral: {}'.format(e))
+                results.put((index, []))
+                continue
+
+            device = self.__next_device
+            self.__next_device = (self.__next_device + 1) % len(self.__device_queues)
+
+            self.__device_queues[device].put((index, input_bytes, results))
+
+    def __infer(self, device):
+        interpreter = self.__interpreters[device]
+        device_queue = self.__device_queues[device]
+
+        while True:
+            task = device_queue.get()
+
+            if task is None:
+                break
+
+            (index, input_bytes, results) = task
+
+            try:
+                with metrics.timer('inference', model='coral', device=str(device)):
+                    raw_detections = self.__invoke(interpreter, input_bytes)
+            except Exception as e:
+                raw_detections = e
+
+            results.put((index, raw_detections))
+
+    def run(self, frames):
+        """
+        Return the raw detections of every frame, in the order of frames.
+        """
+        results = Queue()
+
+        for index, frame in enumerate(frames):
+            self.__preprocess_queue.put((index, frame, results))
+
+        raw_detections_batch = [None] * len(frames)
+
+        # wait for every frame, even after an error, so nothing is still in flight when the next batch starts
+        for i in range(len(frames)):
+            (index, raw_detections) = results.get()
+            raw_detections_batch[index] = raw_detections
+
+        errors = [e for e in raw_detections_batch if isinstance(e, Exception)]
+
+        if errors:
+            raise errors[0]
+
+        return raw_detections_batch
+
+    def stop(self):
+        self.__preprocess_queue.put(None)
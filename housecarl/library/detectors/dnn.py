@@ -0,0 +1,98 @@
+import os
+import cv2
+
+from housecarl.library.common import utility, metrics
+
+# config.detector.dnn_backend values, and the cv2.dnn constant they map to
+DNN_BACKENDS = {
+    'default': 'DNN_BACKEND_DEFAULT',
+    'opencv': 'DNN_BACKEND_OPENCV',
+    'openvino': 'DNN_BACKEND_INFERENCE_ENGINE',
+    'cuda': 'DNN_BACKEND_CUDA',
+    'vulkan': 'DNN_BACKEND_VKCOM'
+}
+
+# config.detector.dnn_target values, and the cv2.dnn constant they map to
+DNN_TARGETS = {
+    'cpu': 'DNN_TARGET_CPU',
+    'opencl': 'DNN_TARGET_OPENCL',
+    'opencl_fp16': 'DNN_TARGET_OPENCL_FP16',
+    'myriad': 'DNN_TARGET_MYRIAD',
+    'cuda': 'DNN_TARGET_CUDA',
+    'cuda_fp16': 'DNN_TARGET_CUDA_FP16',
+    'vulkan': 'DNN_TARGET_VULKAN'
+}
+
+def __get_constant(options, name, config_key):
+    if name not in options:
+        raise Exception('config.detector.{} must be one of {}.'.format(config_key, list(options.keys())))
+
+    constant = getattr(cv2.dnn, options[name], None)
+
+    if constant is None:
+        raise Exception('config.detector.{} "{}" is not supported by this build of OpenCV.'.format(config_key, name))
+
+    return constant
+
+def configure_net(net, config):
+    """
+    Set the preferable backend and target of a cv2.dnn net from config.dnn_backend and config.dnn_target.
+    """
+    net.setPreferableBackend(__get_constant(DNN_BACKENDS, config.get('dnn_backend'), 'dnn_backend'))
+    net.setPreferableTarget(__get_constant(DNN_TARGETS, config.get('dnn_target'), 'dnn_target'))
+
+def apply_threading(config):
+    """
+    Apply config.num_threads and config.cpu_affinity to this process.
+
+    Both are process wide, so with several detectors in one process the last one applied wins.
+    """
+    num_threads = config.get('num_threads')
+    cpu_affinity = config.get('cpu_affinity')
+
+    if num_threads:
+        cv2.setNumThreads(num_threads)
+
+    if cpu_affinity:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpu_affinity)
+        else:
+            utility.warn('config.detector.cpu_affinity is not supported on this platform.')
+
+def report(config, **labels):
+    """
+    Publish the backend, target, thread count and affinity in use as gauges, so they show up in /api/metrics.
+    """
+    model = config.get('model')
+    num_threads = config.get('num_threads') or cv2.getNumThreads()
+    cpu_affinity = config.get('cpu_affinity') or []
+
+    metrics.set_gauge('dnn_threads', num_threads, model=model, **labels)
+    metrics.set_gauge(
+        'dnn_info',
+        1,
+        model=model,
+        backend=config.get('dnn_backend'),
+        target=config.get('dnn_target'),
+        cpu_affinity=','.join(str(cpu) for cpu in cpu_affinity),
+        **labels
+    )
+
+def get_worker_config(config, worker, num_workers):
+    """
+    Split the threads and cpus of config between num_workers processes, so the workers don't oversubscribe the cpu.
+
+    config is a dict. Without config.num_threads, each worker gets an equal share of the cpus.
+    config.cpu_affinity is dealt out to the workers in turn.
+    """
+    worker_config = dict(config)
+    cpu_affinity = config.get('cpu_affinity') or []
+
+    if cpu_affinity:
+        worker_config['cpu_affinity'] = cpu_affinity[worker::num_workers] or cpu_affinity
+
+    if not config.get('num_threads'):
+        num_cpus = len(worker_config['cpu_affinity']) if cpu_affinity else max(1, (os.cpu_count() or 1) // num_workers)
+        worker_config['num_threads'] = max(1, num_cpus)
+
+    return worker_config
@@ -1,15 +1,36 @@
-from housecarl.library.detectors.yolo import YoloDetector
-from housecarl.library.detectors.mobilenet import MobileNetDetector
-from housecarl.library.detectors.coral import CoralDetector
+from housecarl.library.detectors import dnn
 
 def Detector(config):
+    """
+    Build the detector for config.model.
+
+    Only the selected backend is imported, so starting carl doesn't load every framework and model library.
+    """
     model = config.get('model')
 
+    # each worker process builds its own detector
+    if config.get('processes'):
+        from housecarl.library.detectors.process_pool import ProcessPoolDetector
+        return ProcessPoolDetector(config)
+
+    # threads and affinity are applied before the net is loaded, so its thread pool is created with them
+    dnn.apply_threading(config)
+
     if model == 'mobilenet':
-        return MobileNetDetector(config)
+        from housecarl.library.detectors.mobilenet import MobileNetDetector
+        detector = MobileNetDetector(config)
     elif model == 'yolo':
-        return YoloDetector(config)
+        from housecarl.library.detectors.yolo import YoloDetector
+        detector = YoloDetector(config)
     elif model == 'coral':
-        return CoralDetector(config)
+        from housecarl.library.detectors.coral import CoralDetector
+        detector = CoralDetector(config)
+    elif model == 'onnx':
+        from housecarl.library.detectors.onnx import OnnxDetector
+        detector = OnnxDetector(config)
+    else:
+        raise Exception('config.detector.model must be one of ["mobilenet", "yolo", "coral", "onnx"].')
+
+    dnn.report(config)
 
-    raise Exception('config.detector.model must be one of ["mobilenet", "yolo", "coral"].')
+    return detector
@@ -2,9 +2,13 @@ import os
 import cv2
 import numpy as np
 
-from housecarl.library.common import constants, utility
+from housecarl.library.common import constants, utility, metrics
+from housecarl.library.detectors import dnn
 from housecarl.library.detectors.base_detector import BaseDetector
 
+# the size the model was trained at
+INPUT_SIZE = 300
+
 MOBILENET_CLASSES = ["background", "aeroplane", "bicycle", "bird", "boat", "bottle", "bus", "car", "cat", "chair", "cow", "diningtable", "dog", "horse", "motorbike", "person", "pottedplant", "sheep", "sofa", "train", "tvmonitor"]
 
 class MobileNetDetector(BaseDetector):
@@ -13,6 +17,7 @@ class MobileNetDetector(BaseDetector):
         self.__prototxt_path = os.path.join(constants.mobilenet_path, 'MobileNetSSD_deploy.prototxt')
         
         self.config = config
+        self.__input_size = (config.get('input_size') or INPUT_SIZE,) * 2
         self.__set_all_classes()
         self.__read_net()
         
@@ -42,30 +47,61 @@ class MobileNetDetector(BaseDetector):
             self.__model_path
         )
 
+        dnn.configure_net(self.__net, self.config)
+
     def __get_raw_detections(self, frame):
-        blob = cv2.dnn.blobFromImage(frame, size=(300, 300), ddepth=cv2.CV_8U)
-        self.__net.setInput(blob, scalefactor=1.0/127.5, mean=[127.5, 127.5, 127.5])
-        raw_detections = self.__net.forward()
+        with metrics.timer('preprocess', model='mobilenet'):
+            blob = self._get_blob([frame], self.__input_size)
+            self.__net.setInput(blob, scalefactor=1.0/127.5, mean=[127.5, 127.5, 127.5])
+
+        with metrics.timer('inference', model='mobilenet'):
+            raw_detections = self.__net.forward()
 
         return raw_detections
 
+    def __get_raw_detections_batch(self, frames):
+        with metrics.timer('preprocess', model='mobilenet'):
+            blob = self._get_blob(frames, self.__input_size)
+            self.__net.setInput(blob, scalefactor=1.0/127.5, mean=[127.5, 127.5, 127.5])
+
+        with metrics.timer('inference', model='mobilenet'):
+            raw_detections = self.__net.forward()
+
+        # every detection row starts with the index of the image in the batch
+        image_ids = raw_detections[0, 0, :, 0].astype("int")
+
+        return [raw_detections[:, :, image_ids == i, :] for i in range(len(frames))]
+
     def __normalize_detections(self, raw_detections, frame):
-        normalized_detections = []
         (H, W) = frame.shape[:2]
+        rows = raw_detections[0, 0]
+        class_mask = self.get_class_mask()
 
-        for i in np.arange(0, raw_detections.shape[2]):
-            confidence = raw_detections[0, 0, i, 2]
-            class_idx = int(raw_detections[0, 0, i, 1])
-            raw_box = raw_detections[0, 0, i, 3:7]
-            float_box = raw_box * np.array([W, H, W, H])
-            box = float_box.astype("int")
-            normalized_detections.append((class_idx, confidence, box))
+        # drop weak detections and unwanted classes before building any tuples
+        class_ids = rows[:, 1].astype("int")
+        keep = (rows[:, 2] > self.get_min_confidence()) & (class_ids >= 0) & (class_ids < len(class_mask))
+        keep[keep] = class_mask[class_ids[keep]]
 
-        return normalized_detections
+        confidences = rows[keep, 2]
+        boxes = (rows[keep, 3:7] * np.array([W, H, W, H])).astype("int")
+
+        return list(zip(class_ids[keep], confidences, boxes))
 
     def _get_normalized_detections(self, frame):
         # must be provided to the BaseDetector
         raw_detections = self.__get_raw_detections(frame)
-        normalized_detections = self.__normalize_detections(raw_detections, frame)
+
+        with metrics.timer('postprocess', model='mobilenet'):
+            normalized_detections = self.__normalize_detections(raw_detections, frame)
 
         return normalized_detections
+
+    def _get_normalized_detections_batch(self, frames):
+        # may be provided to the BaseDetector
+        raw_detections_batch = self.__get_raw_detections_batch(frames)
+
+        with metrics.timer('postprocess', model='mobilenet'):
+            return [
+                self.__normalize_detections(raw_detections, frame)
+                for raw_detections, frame in zip(raw_detections_batch, frames)
+            ]
@@ -0,0 +1,40 @@
+from housecarl.library.common import utility
+
+# Built in variants of each model. A variant is a set of values that override the detector config,
+# so cheaper variants can run on cameras that matter less.
+#
+# input_size of 0 uses the size the model was trained at.
+# The int8 onnx variant expects a quantized export, which can be made with onnxruntime.quantization.quantize_dynamic.
+MODEL_VARIANTS = {
+    'mobilenet': {'model': 'mobilenet', 'input_size': 300},
+    'mobilenet-256': {'model': 'mobilenet', 'input_size': 256},
+    'yolo': {'model': 'yolo', 'input_size': 416},
+    'yolo-320': {'model': 'yolo', 'input_size': 320},
+    'yolo-256': {'model': 'yolo', 'input_size': 256},
+    'coral': {'model': 'coral'},
+    'onnx': {'model': 'onnx', 'onnx_input_size': 640},
+    'onnx-320': {'model': 'onnx', 'onnx_input_size': 320, 'onnx_model_path': 'yolov8n-320.onnx'},
+    'onnx-int8': {'model': 'onnx', 'onnx_input_size': 640, 'onnx_model_path': 'yolov8n-int8.onnx'},
+}
+
+def get_variants(custom_variants=None):
+    """
+    Return the built in variants, merged with any variants defined in config.detector.variants.
+    """
+    variants = {name: values.copy() for name, values in MODEL_VARIANTS.items()}
+
+    for name, values in (custom_variants or {}).items():
+        if utility.get_typename(values) != 'dict' or 'model' not in values and name not in variants:
+            raise Exception('config.detector.variants.{} must be a dict with a "model" key.'.format(name))
+
+        variants.setdefault(name, {}).update(values)
+
+    return variants
+
+def get_variant(name, custom_variants=None):
+    variants = get_variants(custom_variants)
+
+    if name not in variants:
+        raise Exception('Unknown model variant "{}". Must be one of {}.'.format(name, sorted(variants.keys())))
+
+    return variants[name]
@@ -0,0 +1,114 @@
+import cv2
+import numpy as np
+from time import time
+
+from housecarl.library.common import utility
+
+class MotionGate:
+    def __init__(self, config, detector, regions=None):
+        """
+        Cheap motion pre-filter that only hands frames with motion to the detector.
+
+        config is a CLI_Group and must contain the following keys:
+            method: str - "diff" for downscaled frame differencing or "mog2" for a background subtractor
+            width: int - width frames are downscaled to before looking for motion
+            threshold: int - per pixel intensity change that counts as motion
+            min_area: float - fraction of the watched area that must change
+            hold: int or float - seconds to keep running the detector after motion stops
+            regions: list - polygons of [x, y] points in [0, 1]. Motion outside of these is ignored. Empty watches the whole frame.
+
+        regions overrides config.regions, so each camera can watch its own zones.
+
+        Frames without motion are still passed to on_detections with no detections,
+        so the Monitor counts them as processed frames.
+        """
+        self.config = config
+        self.__detector = detector
+        self.__regions = regions if regions else config.get('regions')
+
+        self.__mask = None
+        self.__last_gray = None
+        self.__last_motion_at = None
+        self.__subtractor = None
+
+        if self.config.get('method') == 'mog2':
+            self.__subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+        elif self.config.get('method') != 'diff':
+            raise Exception('config.motion.method must be one of ["diff", "mog2"].')
+
+    def __get_mask(self, shape):
+        if not self.__regions:
+            return None
+
+        if self.__mask is None or self.__mask.shape != shape:
+            (H, W) = shape
+            self.__mask = np.zeros(shape, dtype=np.uint8)
+            polygons = [(np.array(region) * [W, H]).astype(np.int32) for region in self.__regions]
+            cv2.fillPoly(self.__mask, polygons, 255)
+
+        return self.__mask
+
+    def __get_motion_mask(self, frame):
+        (H, W) = frame.shape[:2]
+        width = min(W, self.config.get('width'))
+        height = max(1, int(H * width / W))
+
+        small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+        if self.__subtractor is not None:
+            return self.__subtractor.apply(small)
+
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+        last_gray = self.__last_gray
+        self.__last_gray = gray
+
+        # treat the first frame, or a change in frame size, as motion
+        if last_gray is None or last_gray.shape != gray.shape:
+            return None
+
+        diff = cv2.absdiff(last_gray, gray)
+        (_, motion_mask) = cv2.threshold(diff, self.config.get('threshold'), 255, cv2.THRESH_BINARY)
+
+        return motion_mask
+
+    def has_motion(self, frame):
+        motion_mask = self.__get_motion_mask(frame)
+
+        if motion_mask is None:
+            return True
+
+        mask = self.__get_mask(motion_mask.shape)
+
+        if mask is not None:
+            motion_mask = cv2.bitwise_and(motion_mask, mask)
+            area = cv2.countNonZero(mask)
+        else:
+            area = motion_mask.size
+
+        if not area:
+            return False
+
+        return cv2.countNonZero(motion_mask) / area >= self.config.get('min_area')
+
+    def get_inference_latency(self, stream=0):
+        return self.__detector.get_inference_latency(stream)
+
+    def process_frame(self, frame, on_detections=None, stream=0, roi=None, draw=True):
+        now = time()
+
+        if self.has_motion(frame):
+            self.__last_motion_at = now
+
+        in_hold = self.__last_motion_at is not None and now - self.__last_motion_at <= self.config.get('hold')
+
+        if in_hold:
+            return self.__detector.process_frame(frame, on_detections=on_detections, stream=stream, roi=roi, draw=draw)
+
+        # a new list every frame, so the Monitor counts this as a processed frame without detections
+        detections = []
+
+        if on_detections:
+            args = (detections) if utility.num_args(on_detections) == 1 else (detections, frame)
+            on_detections(*args)
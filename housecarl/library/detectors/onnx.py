@@ -0,0 +1,222 @@
+import os
+import cv2
+import json
+import hashlib
+import platform
+import numpy as np
+
+from housecarl.library.common import constants, utility, metrics
+from housecarl.library.detectors.base_detector import BaseDetector
+
+try:
+    import onnxruntime
+except Exception as e:
+    onnxruntime = None
+
+NMS_THRESH = 0.45
+CONF_THRESH = 0.25
+
+COCO_CLASSES = ["person", "bicycle", "car", "motorbike", "aeroplane", "bus", "train", "truck", "boat", "traffic light", "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep", "cow", "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee", "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove", "skateboard", "surfboard", "tennis racket", "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple", "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "sofa", "pottedplant", "bed", "diningtable", "toilet", "tvmonitor", "laptop", "mouse", "remote", "keyboard", "cell phone", "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors", "teddy bear", "hair drier", "toothbrush"]
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disabled': 'ORT_DISABLE_ALL',
+    'basic': 'ORT_ENABLE_BASIC',
+    'extended': 'ORT_ENABLE_EXTENDED',
+    'all': 'ORT_ENABLE_ALL'
+}
+
+def decode_detections(output, num_classes, W, H, input_size, class_mask=None, min_confidence=None):
+    """
+    Turn the output of a YOLOv5 or YOLOv8 style export into a list of (class_id, confidence, box) after non-maxima suppression.
+
+    YOLOv5 rows are [cx, cy, w, h, objectness, *class_scores] and YOLOv8 rows are [cx, cy, w, h, *class_scores],
+    with YOLOv8 outputs transposed to (1, 4 + num_classes, num_boxes). Boxes are in input pixels.
+
+    Like yolo.decode_detections, class_mask and min_confidence drop detections after NMS without building them.
+    """
+    rows = output.reshape(output.shape[-2:])
+
+    if rows.shape[1] not in [num_classes + 4, num_classes + 5]:
+        rows = rows.T
+
+    if rows.shape[1] == num_classes + 5:
+        scores = rows[:, 5:] * rows[:, 4:5]
+    else:
+        scores = rows[:, 4:]
+
+    max_scores = scores.max(axis=1)
+    keep = max_scores > CONF_THRESH
+
+    if not np.any(keep):
+        return []
+
+    kept = rows[keep]
+    class_ids = np.argmax(scores[keep], axis=1)
+    kept_scores = max_scores[keep]
+
+    (input_w, input_h) = input_size
+    w = kept[:, 2] * W / input_w
+    h = kept[:, 3] * H / input_h
+    x = kept[:, 0] * W / input_w - w / 2
+    y = kept[:, 1] * H / input_h - h / 2
+
+    boxes = np.stack([x, y, w, h], axis=1).tolist()
+    confs = kept_scores.tolist()
+
+    indices = np.array(cv2.dnn.NMSBoxes(boxes, confs, CONF_THRESH, NMS_THRESH), dtype=int).flatten()
+
+    if class_mask is not None:
+        indices = indices[class_mask[class_ids[indices]]]
+
+    if min_confidence is not None:
+        indices = indices[kept_scores[indices] > min_confidence]
+
+    normalized_detections = []
+
+    for i in indices:
+        x, y, w, h = boxes[i]
+        box = [round(x), round(y), round(x + w), round(y + h)]
+        normalized_detections.append((class_ids[i], confs[i], box))
+
+    return normalized_detections
+
+class OnnxDetector(BaseDetector):
+    def __init__(self, config):
+        """
+        Run an ONNX detection model, such as a YOLOv5 or YOLOv8 export, with ONNX Runtime.
+
+        config must contain the following keys, in addition to those used by the BaseDetector:
+            onnx_model_path: str - path to the .onnx file. Relative paths are resolved against the models/onnx directory.
+            onnx_labels_path: str - optional path to a file with one class name per line, relative to models/onnx. Defaults to the COCO classes.
+            onnx_input_size: int - width and height the model expects.
+            onnx_providers: List<str> - ONNX Runtime execution providers, in order of preference, e.g. "OpenVINOExecutionProvider".
+            intra_op_threads: int - threads used within an operator. 0 lets ONNX Runtime decide.
+            inter_op_threads: int - threads used across operators. 0 lets ONNX Runtime decide.
+            graph_optimization: str - one of "disabled", "basic", "extended" or "all".
+            model_cache: bool - save the optimized graph (CPU provider only) and the compiled OpenVINO blobs to models/cache and load them on the next start.
+        """
+        if onnxruntime is None:
+            raise Exception('Could not import "onnxruntime". Run "pip install onnxruntime" to use the onnx model.')
+
+        self.config = config
+        self.__model_path = os.path.join(constants.onnx_path, config.get('onnx_model_path'))
+        self.__input_size = (config.get('onnx_input_size'), config.get('onnx_input_size'))
+
+        self.__set_all_classes()
+        self.__init_session()
+
+        super().__init__(config)
+
+    def __set_all_classes(self):
+        labels_path = self.config.get('onnx_labels_path')
+
+        if not labels_path:
+            all_classes = COCO_CLASSES
+        else:
+            # resolved the same way as onnx_model_path
+            labels_path = os.path.join(constants.onnx_path, labels_path)
+
+            with open(labels_path, 'r') as f:
+                all_classes = [line.strip() for line in f.readlines() if line.strip()]
+
+        self.__num_classes = len(all_classes)
+        self.set_all_classes(all_classes)
+
+    def __get_session_options(self):
+        options = onnxruntime.SessionOptions()
+
+        if self.config.get('intra_op_threads'):
+            options.intra_op_num_threads = self.config.get('intra_op_threads')
+
+        if self.config.get('inter_op_threads'):
+            options.inter_op_num_threads = self.config.get('inter_op_threads')
+
+            # inter op threads only matter when independent branches may run in parallel
+            if self.config.get('inter_op_threads') > 1:
+                options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+
+        level = GRAPH_OPTIMIZATION_LEVELS.get(self.config.get('graph_optimization'))
+
+        if level is None:
+            raise Exception('config.detector.graph_optimization must be one of {}.'.format(list(GRAPH_OPTIMIZATION_LEVELS.keys())))
+
+        options.graph_optimization_level = getattr(onnxruntime.GraphOptimizationLevel, level)
+
+        return options
+
+    def __get_providers(self):
+        available = onnxruntime.get_available_providers()
+        providers = [p for p in self.config.get('onnx_providers') if p in available]
+
+        [utility.warn('ONNX Runtime provider "{}" is not available.'.format(p)) for p in self.config.get('onnx_providers') if p not in available]
+
+        return providers if providers else ['CPUExecutionProvider']
+
+    def __get_cache_path(self, providers):
+        """
+        The optimized graph depends on the model, the optimization level, the providers, the ONNX Runtime version
+        and the cpu, as the "all" level bakes in hardware specific kernels.
+        """
+        stat = os.stat(self.__model_path)
+        key = [self.__model_path, stat.st_mtime, stat.st_size, self.config.get('graph_optimization'), providers, onnxruntime.__version__, platform.machine()]
+        digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()[:12]
+        name = os.path.splitext(os.path.basename(self.__model_path))[0]
+
+        return os.path.join(constants.model_cache_path, 'onnx', '{}-{}.onnx'.format(name, digest))
+
+    def __get_provider_options(self, providers):
+        # OpenVINO compiles the graph for the device on every start unless it has a cache dir
+        cache_dir = os.path.join(constants.model_cache_path, 'openvino')
+
+        return [{'cache_dir': cache_dir} if provider == 'OpenVINOExecutionProvider' and self.config.get('model_cache') else {} for provider in providers]
+
+    def __init_session(self):
+        if not os.path.exists(self.__model_path):
+            raise Exception('Cannot find ONNX model at {}. Export one (e.g. YOLOv8) and set config.detector.onnx_model_path.'.format(self.__model_path))
+
+        model_path = self.__model_path
+        options = self.__get_session_options()
+        providers = self.__get_providers()
+
+        # graphs optimized for other providers contain nodes only that provider can run, which don't load back reliably
+        if self.config.get('model_cache') and providers == ['CPUExecutionProvider']:
+            cache_path = self.__get_cache_path(providers)
+
+            if os.path.exists(cache_path):
+                # the cached graph has already been optimized
+                model_path = cache_path
+                options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+            else:
+                utility.ensure_dir(os.path.dirname(cache_path))
+                options.optimized_model_filepath = cache_path
+
+        self.__session = onnxruntime.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=providers,
+            provider_options=self.__get_provider_options(providers)
+        )
+
+        self.__input_name = self.__session.get_inputs()[0].name
+        self.__output_names = [self.__session.get_outputs()[0].name]
+
+    def __get_raw_detections(self, frame):
+        with metrics.timer('preprocess', model='onnx'):
+            blob = self._get_blob([frame], self.__input_size, dtype=np.float32, scale=1/255, swap_rb=True)
+
+        with metrics.timer('inference', model='onnx'):
+            raw_detections = self.__session.run(self.__output_names, {self.__input_name: blob})[0]
+
+        return raw_detections
+
+    def _get_normalized_detections(self, frame):
+        # must be provided to the BaseDetector
+        raw_detections = self.__get_raw_detections(frame)
+        (H, W) = frame.shape[:2]
+
+        with metrics.timer('postprocess', model='onnx'):
+            normalized_detections = decode_detections(
+                raw_detections, self.__num_classes, W, H, self.__input_size, self.get_class_mask(), self.get_min_confidence()
+            )
+
+        return normalized_detections
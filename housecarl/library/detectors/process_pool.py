@@ -0,0 +1,277 @@
+import numpy as np
+import multiprocessing as mp
+from time import time
+from queue import Empty
+from threading import Thread, Lock
+
+from housecarl.library.common import utility, metrics
+from housecarl.library.detectors import dnn
+from housecarl.library.camera.image import draw_detection
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except Exception as e:
+    shared_memory = None
+
+# the pool keeps this many frame slots per worker, so every worker can have a frame waiting while another is read
+SLOTS_PER_WORKER = 2
+
+def _run_worker(config, task_queue, result_queue):
+    """
+    Entry point of a worker process. Loads its own detector and runs detections on frames read from shared memory.
+
+    The timings the detector records are sent back with each result, so the parent can report them.
+    """
+    # imported here so the parent process never loads a net
+    from housecarl.library.detectors.get_detector import Detector
+
+    # every worker must draw the same colors for the same classes
+    np.random.seed(0)
+
+    detector = Detector(config)
+    detector.warm_up(background=False)
+    attached = {}
+
+    # the warm up isn't part of any request
+    metrics.record_observations()
+
+    while True:
+        task = task_queue.get()
+
+        # None is the shutdown sentinel
+        if task is None:
+            break
+
+        (slot, shm_name, shape, dtype, stream, request_id, roi) = task
+
+        if attached.get(slot) is None or attached[slot].name != shm_name:
+            if attached.get(slot) is not None:
+                attached[slot].close()
+                attached[slot] = None
+
+            # the parent may have already freed the slot, e.g. while shutting down
+            try:
+                attached[slot] = shared_memory.SharedMemory(name=shm_name)
+            except FileNotFoundError:
+                result_queue.put((slot, stream, request_id, [], []))
+                continue
+
+        frame = np.ndarray(shape, dtype=dtype, buffer=attached[slot].buf)
+        detections = detector.get_valid_detections(frame, roi)
+
+        # release the view before handing the slot back to the parent
+        del frame
+
+        result_queue.put((slot, stream, request_id, detections, metrics.take_observations()))
+
+    [shm.close() for shm in attached.values() if shm is not None]
+
+class ProcessPoolDetector:
+    def __init__(self, config):
+        """
+        Run detections in a pool of worker processes, each with its own net.
+
+        Frames are copied into a ring of shared memory slots instead of being pickled, and only the slot
+        index and the detections are sent between processes.
+
+        Each worker has its own task queue, so the pool knows which worker holds each slot. A slot is only
+        freed by its result, or when the worker holding it has died, never while a worker may still read it.
+
+        config.processes is the number of worker processes to start.
+        """
+        if shared_memory is None:
+            raise Exception('config.detector.processes requires python 3.8 or later.')
+
+        self.config = config
+        self.__num_workers = max(1, self.config.get('processes'))
+        self.__lock = Lock()
+
+        self.__slots = [None] * (self.__num_workers * SLOTS_PER_WORKER)
+        self.__free_slots = list(range(len(self.__slots)))
+
+        # per stream bookkeeping, used to drop results that arrive after a newer frame's results
+        self.__next_request_id = 0
+        self.__pending = {}
+        self.__in_flight = {}
+        self.__last_request_id = {}
+        self.__last_detections = {}
+        self.__latencies = {}
+
+        worker_config = config.dict()
+        worker_config['threaded'] = False
+        worker_config['processes'] = 0
+
+        # share the cpus between the workers, so the pool doesn't start a full thread pool per process
+        self.__worker_configs = [dnn.get_worker_config(worker_config, i, self.__num_workers) for i in range(self.__num_workers)]
+        [dnn.report(self.__worker_configs[i], worker=str(i)) for i in range(self.__num_workers)]
+
+        # spawn so the workers don't inherit the parent's OpenCV threads
+        self.__context = mp.get_context('spawn')
+        self.__task_queues = [None] * self.__num_workers
+        self.__result_queue = self.__context.Queue()
+
+        utility.info('Starting {} detector processes...'.format(self.__num_workers))
+
+        # workers must share the parent's resource tracker, otherwise a worker's tracker
+        # unlinks the shared frames when that worker exits
+        resource_tracker.ensure_running()
+
+        self.__workers = [self.__start_worker(i) for i in range(self.__num_workers)]
+
+        self.__thread_active = True
+        self.__thread = Thread(target=self.__collect_results, args=())
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __start_worker(self, i):
+        # a new queue, so a replacement never runs the tasks of the worker it replaces, whose slots are already freed
+        self.__task_queues[i] = self.__context.Queue()
+
+        worker = self.__context.Process(
+            target=_run_worker,
+            args=(self.__worker_configs[i], self.__task_queues[i], self.__result_queue),
+            daemon=True
+        )
+        worker.start()
+
+        return worker
+
+    def __replace_dead_workers(self):
+        for i, worker in enumerate(self.__workers):
+            if not worker.is_alive() and self.__thread_active:
+                utility.error('Detector process {} exited with code {}. Restarting it.'.format(i, worker.exitcode))
+
+                # the frames it was given will never come back
+                with self.__lock:
+                    lost = [request_id for (request_id, pending) in self.__pending.items() if pending[3] == i]
+                    [self.__reclaim(request_id) for request_id in lost]
+
+                self.__workers[i] = self.__start_worker(i)
+
+    def __reclaim(self, request_id):
+        """
+        Stop waiting for a request and free its slot. The lock must be held.
+        """
+        (slot, stream, submitted_at, worker) = self.__pending.pop(request_id)
+        self.__free_slots.append(slot)
+        self.__in_flight[stream] -= 1
+
+        return (submitted_at, worker)
+
+    def __collect_results(self):
+        while self.__thread_active:
+            self.__replace_dead_workers()
+
+            try:
+                (slot, stream, request_id, detections, observations) = self.__result_queue.get(timeout=1)
+            except Empty:
+                continue
+
+            with self.__lock:
+                # the worker was replaced, and its slots have already been freed
+                if request_id not in self.__pending:
+                    continue
+
+                (submitted_at, worker) = self.__reclaim(request_id)
+
+                # results can come back out of order, only keep the newest
+                if request_id > self.__last_request_id.get(stream, -1):
+                    self.__last_request_id[stream] = request_id
+                    self.__last_detections[stream] = detections
+
+            # the detector stages were timed in the worker
+            [metrics.observe(stage, seconds, worker=str(worker), **labels) for (stage, seconds, labels) in observations]
+
+            latency = time() - submitted_at
+            self.__latencies[stream] = latency
+            metrics.observe('pool_inference', latency, model=self.config.get('model'))
+
+    def __get_slot(self, slot, nbytes):
+        shm = self.__slots[slot]
+
+        # grow the slot if the frame doesn't fit
+        if shm is None or shm.size < nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+            shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.__slots[slot] = shm
+
+        return shm
+
+    def __submit(self, frame, stream, roi):
+        with self.__lock:
+            self.__in_flight.setdefault(stream, 0)
+            self.__last_detections.setdefault(stream, [])
+
+            # keep at most one frame per worker in flight for each stream
+            if not self.__free_slots or self.__in_flight[stream] >= self.__num_workers:
+                return
+
+            slot = self.__free_slots.pop()
+            self.__in_flight[stream] += 1
+            request_id = self.__next_request_id
+            self.__next_request_id += 1
+
+            # give the frame to the worker with the fewest frames waiting
+            num_pending = [0] * self.__num_workers
+            for pending in self.__pending.values():
+                num_pending[pending[3]] += 1
+
+            worker = num_pending.index(min(num_pending))
+            task_queue = self.__task_queues[worker]
+            self.__pending[request_id] = (slot, stream, time(), worker)
+
+        shm = self.__get_slot(slot, frame.nbytes)
+        shared_frame = np.ndarray(frame.shape, dtype=frame.dtype, buffer=shm.buf)
+        shared_frame[:] = frame
+        del shared_frame
+
+        task_queue.put((slot, shm.name, frame.shape, frame.dtype.str, stream, request_id, roi))
+
+    def draw_detections(self, frame, detections):
+        for detection in detections:
+            draw_detection(frame, detection)
+
+    def warm_up(self, background=True):
+        # every worker warms up its own net before taking frames
+        pass
+
+    def get_inference_latency(self, stream=0):
+        """
+        Seconds from handing the last frame of stream to the pool until its detections came back, or None before the first one.
+        """
+        return self.__latencies.get(stream)
+
+    def terminate_thread(self):
+        if not self.__thread_active:
+            return
+
+        self.__thread_active = False
+
+        [task_queue.put(None) for task_queue in self.__task_queues]
+        [worker.join(timeout=5) for worker in self.__workers]
+
+        for shm in self.__slots:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    def process_frame(self, frame, on_detections=None, stream=0, roi=None, draw=True):
+        """
+        Hand a frame to the pool and pass the latest detections for its stream to on_detections.
+
+        Like threaded mode, detections may be stale. A stale result is the same list as the previous call.
+        """
+        self.__submit(frame, stream, roi)
+
+        with self.__lock:
+            last_detections = self.__last_detections[stream]
+
+        if draw and self.config.get('show_detections') and last_detections:
+            self.draw_detections(frame, last_detections)
+
+        if on_detections:
+            args = (last_detections) if utility.num_args(on_detections) == 1 else (last_detections, frame)
+            on_detections(*args)
@@ -0,0 +1,137 @@
+import cv2
+import numpy as np
+from math import ceil
+
+# boxes from neighbouring tiles that overlap more than this are treated as the same object
+MERGE_THRESH = 0.5
+
+class Roi:
+    def __init__(self, regions=None, tile_size=0, tile_overlap=0.2):
+        """
+        Region of interest of a single camera.
+
+        Frames are cropped to the bounding rectangle of the regions before inference, so the model's input
+        is spent on the part of the frame we care about. A crop larger than tile_size is split into
+        overlapping tiles, which are run through the net as a single batch.
+
+        regions: list - polygons of [x, y] points in [0, 1]. Detections centered outside of these are dropped. Empty uses the whole frame.
+        tile_size: int - max width and height of a tile, in pixels of the processed frame. 0 never tiles.
+        tile_overlap: float - fraction of a tile shared with its neighbours, so objects on a seam are seen whole by one tile.
+        """
+        self.__regions = [np.array(region, dtype=np.float64) for region in (regions or [])]
+        self.__tile_size = tile_size or 0
+        self.__tile_overlap = min(max(tile_overlap or 0, 0), 0.9)
+
+        # tiles and masks only depend on the frame size, so they are computed once
+        self.__shape = None
+        self.__tiles = None
+        self.__mask = None
+
+    def __get_polygons(self, W, H):
+        return [np.round(region * [W, H]).astype(np.int32) for region in self.__regions]
+
+    def __get_bounds(self, W, H):
+        if not self.__regions:
+            return (0, 0, W, H)
+
+        points = np.vstack(self.__get_polygons(W, H))
+        (x1, y1) = np.clip(points.min(axis=0), 0, [W, H])
+        (x2, y2) = np.clip(points.max(axis=0), 0, [W, H])
+
+        return (int(x1), int(y1), int(max(x2, x1 + 1)), int(max(y2, y1 + 1)))
+
+    def __get_offsets(self, start, end):
+        length = end - start
+        tile_length = min(self.__tile_size, length) if self.__tile_size else length
+
+        if tile_length >= length:
+            return [(start, end)]
+
+        step = max(1, tile_length * (1 - self.__tile_overlap))
+        count = ceil((length - tile_length) / step) + 1
+
+        offsets = []
+
+        # spread the tiles evenly, so the first and last tiles line up with the edges of the crop
+        for i in range(count):
+            offset = start + round(i * (length - tile_length) / (count - 1))
+            offsets.append((offset, offset + tile_length))
+
+        return offsets
+
+    def __update(self, shape):
+        if self.__shape == shape:
+            return
+
+        (H, W) = shape
+        (x1, y1, x2, y2) = self.__get_bounds(W, H)
+
+        self.__shape = shape
+        self.__tiles = [
+            (tx1, ty1, tx2, ty2)
+            for (ty1, ty2) in self.__get_offsets(y1, y2)
+            for (tx1, tx2) in self.__get_offsets(x1, x2)
+        ]
+
+        self.__mask = None
+        if self.__regions:
+            self.__mask = np.zeros(shape, dtype=np.uint8)
+            cv2.fillPoly(self.__mask, self.__get_polygons(W, H), 255)
+
+    def get_tiles(self, shape):
+        """
+        Return the (x1, y1, x2, y2) pixel rectangles to run inference on for a frame of the given (height, width).
+        """
+        self.__update(tuple(shape[:2]))
+
+        return self.__tiles
+
+    def crop(self, frame):
+        """
+        Return a view of the frame for every tile. Crops are views, so no pixels are copied.
+        """
+        return [frame[y1:y2, x1:x2] for (x1, y1, x2, y2) in self.get_tiles(frame.shape)]
+
+    def __in_regions(self, box):
+        if self.__mask is None:
+            return True
+
+        (H, W) = self.__mask.shape
+        center_x = min(max(int((box[0] + box[2]) / 2), 0), W - 1)
+        center_y = min(max(int((box[1] + box[3]) / 2), 0), H - 1)
+
+        return self.__mask[center_y, center_x] > 0
+
+    def map_detections(self, detections_per_tile, shape):
+        """
+        Map normalized (class_id, confidence, box) detections of each tile back to frame coordinates,
+        drop those outside the regions and merge duplicates found by overlapping tiles.
+        """
+        tiles = self.get_tiles(shape)
+        detections = []
+
+        for (x1, y1, x2, y2), tile_detections in zip(tiles, detections_per_tile):
+            for (class_id, confidence, box) in tile_detections:
+                frame_box = [int(box[0]) + x1, int(box[1]) + y1, int(box[2]) + x1, int(box[3]) + y1]
+
+                if self.__in_regions(frame_box):
+                    detections.append((class_id, confidence, frame_box))
+
+        if len(tiles) == 1 or len(detections) < 2:
+            return detections
+
+        return self.__merge(detections)
+
+    def __merge(self, detections):
+        merged = []
+        class_ids = set(class_id for (class_id, confidence, box) in detections)
+
+        for class_id in class_ids:
+            class_detections = [d for d in detections if d[0] == class_id]
+            boxes = [[box[0], box[1], box[2] - box[0], box[3] - box[1]] for (_, _, box) in class_detections]
+            confidences = [float(confidence) for (_, confidence, _) in class_detections]
+
+            indices = cv2.dnn.NMSBoxes(boxes, confidences, 0, MERGE_THRESH)
+            merged += [class_detections[i] for i in np.array(indices).flatten()]
+
+        return merged
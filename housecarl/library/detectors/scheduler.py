@@ -0,0 +1,98 @@
+from time import time
+
+from housecarl.library.common import utility
+from housecarl.library.camera.image import draw_detection
+
+# weight given to the newest latency measurement
+LATENCY_SMOOTHING = 0.2
+
+class InferenceScheduler:
+    def __init__(self, config, detector, monitor=None, target_fps=None, idle_fps=None, tracker=None):
+        """
+        Decide which frames of a camera are handed to the detector.
+
+        config is the detector CLI_Group and must contain the following keys:
+            target_fps: int or float - detections per second while a detection series is in progress. 0 runs every frame.
+            idle_fps: int or float - detections per second otherwise. 0 uses target_fps.
+            max_inference_load: float - max fraction of the time the detector may spend on this camera. 0 disables.
+            show_detections: bool
+
+        target_fps and idle_fps override the config unless they are None, so each camera can have its own rate.
+
+        Frames that are skipped are passed to on_detections with the previous detections, which the Monitor treats as stale.
+        With a Tracker, skipped frames get the predicted boxes of each track instead, and every detection carries a track id.
+        """
+        self.config = config
+        self.__detector = detector
+        self.__monitor = monitor
+        self.__tracker = tracker
+        # a camera may override the config with 0, e.g. to run every frame while the config throttles
+        self.__target_fps = target_fps if target_fps is not None else config.get('target_fps')
+        self.__idle_fps = (idle_fps if idle_fps is not None else config.get('idle_fps')) or self.__target_fps
+
+        self.__latency = None
+        self.__next_run_at = 0
+        self.__last_detections = []
+
+    def __is_active(self):
+        return self.__monitor is not None and self.__monitor.in_detection_series()
+
+    def __update_latency(self, latency):
+        if self.__latency is None:
+            self.__latency = latency
+        else:
+            self.__latency = (1 - LATENCY_SMOOTHING) * self.__latency + LATENCY_SMOOTHING * latency
+
+    def get_interval(self):
+        """
+        Seconds to wait between detections, based on the series state and the inference latency measured by the detector.
+        """
+        fps = self.__target_fps if self.__is_active() else self.__idle_fps
+        interval = 1 / fps if fps else 0
+
+        # back off when inference is slow, so one camera doesn't keep the detector busy
+        max_load = self.config.get('max_inference_load')
+        if self.__latency is not None and max_load:
+            interval = max(interval, self.__latency / max_load)
+
+        return interval
+
+    def get_latency(self):
+        return self.__latency
+
+    def __call_handler(self, handler, detections, frame):
+        if handler:
+            args = (detections) if utility.num_args(handler) == 1 else (detections, frame)
+            handler(*args)
+
+    def __draw_detections(self, frame, detections):
+        if self.config.get('show_detections'):
+            [draw_detection(frame, detection) for detection in detections]
+
+    def process_frame(self, frame, on_detections=None, stream=0, roi=None):
+        started_at = time()
+
+        if started_at < self.__next_run_at:
+            detections = self.__last_detections if self.__tracker is None else self.__tracker.predict(frame)
+            self.__draw_detections(frame, detections)
+
+            return self.__call_handler(on_detections, detections, frame)
+
+        def handle_detections(detections, frame):
+            if self.__tracker is not None:
+                detections = self.__tracker.update(frame, detections)
+                self.__draw_detections(frame, detections)
+
+            self.__last_detections = detections
+            self.__call_handler(on_detections, detections, frame)
+
+        # the tracker's boxes are drawn instead of the detector's
+        self.__detector.process_frame(frame, on_detections=handle_detections, stream=stream, roi=roi, draw=self.__tracker is None)
+
+        # measured by the detector, as threaded and pooled detectors return before inference is done
+        # and a synchronous detector's time includes the handlers
+        latency = self.__detector.get_inference_latency(stream)
+        if latency is not None:
+            self.__update_latency(latency)
+
+        self.__next_run_at = started_at + self.get_interval()
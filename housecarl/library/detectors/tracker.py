@@ -0,0 +1,203 @@
+import cv2
+import numpy as np
+from time import time
+
+from housecarl.library.common import utility
+
+TRACKER_METHODS = ['iou', 'kcf', 'mosse']
+
+# weight given to the newest velocity measurement
+VELOCITY_SMOOTHING = 0.5
+
+class TrackedDetection(tuple):
+    """
+    A (label, confidence, box, color) detection that also carries the id of the track it belongs to.
+    It unpacks like any other detection.
+    """
+    def __new__(cls, detection, track_id):
+        tracked_detection = super().__new__(cls, detection)
+        tracked_detection.track_id = track_id
+
+        return tracked_detection
+
+class TrackedDetections(list):
+    """
+    The detections of a single frame. predicted is True when the boxes were propagated
+    by the tracker rather than found by the detector, so they don't count as a processed frame.
+    """
+    def __init__(self, detections=(), predicted=False):
+        super().__init__(detections)
+        self.predicted = predicted
+
+def _create_cv2_tracker(method):
+    name = {'kcf': 'TrackerKCF_create', 'mosse': 'TrackerMOSSE_create'}[method]
+
+    # the trackers moved to cv2.legacy in OpenCV 4.5.1
+    for module in [getattr(cv2, 'legacy', None), cv2]:
+        if module is not None and hasattr(module, name):
+            return getattr(module, name)()
+
+    raise Exception('config.detector.tracker "{}" requires opencv-contrib-python.'.format(method))
+
+class Track:
+    def __init__(self, track_id, detection, frame, method, now):
+        (label, confidence, box, color) = detection
+
+        self.id = track_id
+        self.label = label
+        self.confidence = confidence
+        self.color = color
+        self.box = np.array(box, dtype=np.float64)
+        self.velocity = np.zeros(4)
+        self.updated_at = now
+        self.matched = True
+
+        self.__method = method
+        self.__cv2_tracker = None
+        self.__init_cv2_tracker(frame)
+
+    def __init_cv2_tracker(self, frame):
+        if self.__method == 'iou':
+            return
+
+        (H, W) = frame.shape[:2]
+        (x1, y1, x2, y2) = np.clip(self.box, 0, [W, H, W, H]).astype(int)
+
+        self.__cv2_tracker = None
+
+        if x2 - x1 > 1 and y2 - y1 > 1:
+            self.__cv2_tracker = _create_cv2_tracker(self.__method)
+            self.__cv2_tracker.init(frame, (int(x1), int(y1), int(x2 - x1), int(y2 - y1)))
+
+    def update(self, detection, frame, now):
+        (label, confidence, box, color) = detection
+        box = np.array(box, dtype=np.float64)
+        dt = now - self.updated_at
+
+        if dt > 0:
+            velocity = (box - self.box) / dt
+            self.velocity = (1 - VELOCITY_SMOOTHING) * self.velocity + VELOCITY_SMOOTHING * velocity
+
+        self.confidence = confidence
+        self.box = box
+        self.updated_at = now
+        self.matched = True
+
+        self.__init_cv2_tracker(frame)
+
+    def predict(self, frame, now):
+        """
+        Return where the box is in this frame, following the pixels with the cv2 tracker,
+        or extrapolating the last known velocity.
+        """
+        if self.__cv2_tracker is not None:
+            (ok, (x, y, w, h)) = self.__cv2_tracker.update(frame)
+
+            if ok:
+                return [int(x), int(y), int(x + w), int(y + h)]
+
+        (H, W) = frame.shape[:2]
+        box = self.box + self.velocity * (now - self.updated_at)
+
+        return np.clip(box, 0, [W, H, W, H]).astype(int).tolist()
+
+    def to_detection(self, box):
+        return TrackedDetection((self.label, self.confidence, box, self.color), self.id)
+
+class Tracker:
+    def __init__(self, config):
+        """
+        Follow the detections of a single camera between the frames the detector runs on,
+        and give each object a track id that is stable across frames.
+
+        config is the detector CLI_Group and must contain the following keys:
+            tracker: str - "iou" associates boxes by overlap and extrapolates their velocity.
+                           "kcf" or "mosse" also follow the pixels with an OpenCV tracker, which needs opencv-contrib-python.
+            track_iou: float - min overlap between a track and a new detection of the same label to continue the track
+            track_max_age: float - seconds a track is kept without being matched to a detection
+        """
+        self.config = config
+        self.__method = config.get('tracker')
+
+        if self.__method not in TRACKER_METHODS:
+            raise Exception('config.detector.tracker must be one of {}.'.format(TRACKER_METHODS))
+
+        # fail early if opencv-contrib-python is missing
+        if self.__method != 'iou':
+            _create_cv2_tracker(self.__method)
+
+        self.__tracks = []
+        self.__next_id = 1
+        self.__last_detections = None
+
+    def __match(self, detections):
+        """
+        Greedily pair detections with tracks of the same label, best overlap first.
+        """
+        min_iou = self.config.get('track_iou')
+        pairs = []
+
+        for i, (label, confidence, box, color) in enumerate(detections):
+            for track in self.__tracks:
+                if track.label == label:
+                    iou = utility.get_iou(box, track.box)
+
+                    if iou >= min_iou:
+                        pairs.append((iou, i, track))
+
+        matches = {}
+        matched_tracks = set()
+
+        for (iou, i, track) in sorted(pairs, key=lambda pair: -pair[0]):
+            if i not in matches and track.id not in matched_tracks:
+                matches[i] = track
+                matched_tracks.add(track.id)
+
+        return matches
+
+    def update(self, frame, detections):
+        """
+        Take the detections the detector returned for this frame and return them with track ids.
+
+        A stale list, the same list as the previous call, is replaced with the predicted boxes of the tracks.
+        """
+        if detections is self.__last_detections:
+            return self.predict(frame)
+
+        self.__last_detections = detections
+        now = time()
+        matches = self.__match(detections)
+        tracked_detections = TrackedDetections()
+
+        for track in self.__tracks:
+            track.matched = False
+
+        for i, detection in enumerate(detections):
+            track = matches.get(i)
+
+            if track is not None:
+                track.update(detection, frame, now)
+            else:
+                track = Track(self.__next_id, detection, frame, self.__method, now)
+                self.__next_id += 1
+                self.__tracks.append(track)
+
+            tracked_detections.append(TrackedDetection(detection, track.id))
+
+        max_age = self.config.get('track_max_age')
+        self.__tracks = [track for track in self.__tracks if now - track.updated_at <= max_age]
+
+        return tracked_detections
+
+    def predict(self, frame):
+        """
+        Return the predicted boxes of the tracks that were seen by the last detection, for a frame the detector skipped.
+        """
+        now = time()
+        max_age = self.config.get('track_max_age')
+
+        return TrackedDetections([
+            track.to_detection(track.predict(frame, now))
+            for track in self.__tracks
+            if track.matched and now - track.updated_at <= max_age
+        ], predicted=True)
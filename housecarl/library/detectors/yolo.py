@@ -2,7 +2,8 @@ import os
 import cv2
 import numpy as np
 
-from housecarl.library.common import constants, utility
+from housecarl.library.common import constants, utility, metrics
+from housecarl.library.detectors import dnn
 from housecarl.library.detectors.base_detector import BaseDetector
 
 # constants
@@ -10,6 +11,60 @@ SCALE = 1/255
 NMS_THRESH = 0.4
 CONF_THRESH = 0.5
 
+# the size the model was trained at. Smaller multiples of 32 are faster but less accurate
+INPUT_SIZE = 416
+
+def decode_detections(raw_detections, W, H, class_mask=None, min_confidence=None):
+    """
+    Turn the raw output layers of YOLO into a list of (class_id, confidence, box) after non-maxima suppression.
+
+    Every step runs on whole arrays. Rows below CONF_THRESH can never survive NMSBoxes,
+    so they are dropped before the argmax and box conversion.
+
+    class_mask is an optional bool array of the classes to keep, and min_confidence an optional threshold.
+    NMS still runs over every class, so the same boxes survive, but the others are never turned into detections.
+    """
+    outputs = raw_detections[0] if len(raw_detections) == 1 else np.vstack(raw_detections)
+
+    max_scores = outputs[:, 5:].max(axis=1)
+    keep = max_scores > CONF_THRESH
+
+    if not np.any(keep):
+        return []
+
+    kept = outputs[keep]
+    class_ids = np.argmax(kept[:, 5:], axis=1)
+    kept_scores = max_scores[keep]
+
+    # int() truncates toward zero, as does astype
+    center_x = (kept[:, 0] * W).astype(int)
+    center_y = (kept[:, 1] * H).astype(int)
+    w = (kept[:, 2] * W).astype(int)
+    h = (kept[:, 3] * H).astype(int)
+    x = center_x - w / 2
+    y = center_y - h / 2
+
+    boxes = np.stack([x, y, w, h], axis=1).tolist()
+    confs = kept_scores.tolist()
+
+    # apply non-maxima suppression
+    indices = np.array(cv2.dnn.NMSBoxes(boxes, confs, CONF_THRESH, NMS_THRESH), dtype=int).flatten()
+
+    if class_mask is not None:
+        indices = indices[class_mask[class_ids[indices]]]
+
+    if min_confidence is not None:
+        indices = indices[kept_scores[indices] > min_confidence]
+
+    normalized_detections = []
+
+    for i in indices:
+        x, y, w, h = boxes[i]
+        box = [round(x), round(y), round(x + w), round(y + h)]
+        normalized_detections.append((class_ids[i], confs[i], box))
+
+    return normalized_detections
+
 # @article{yolov3,
 #   title={YOLOv3: An Incremental Improvement},
 #   author={Redmon, Joseph and Farhadi, Ali},
@@ -23,9 +78,10 @@ class YoloDetector(BaseDetector):
         self.__cfg_path = os.path.join(constants.yolo_path, 'yolov3.cfg')
         self.__weights_path = os.path.join(constants.yolo_path, 'yolov3.weights')
 
+        self.config = config
         self._set_all_classes()
         self._read_net()
-        self.config = config
+        self.__input_size = (config.get('input_size') or INPUT_SIZE,) * 2
         super().__init__(config)
 
     def __download_model_files(self):
@@ -55,70 +111,61 @@ class YoloDetector(BaseDetector):
         # read the pretrained model and configs
         self.__net = cv2.dnn.readNetFromDarknet(self.__cfg_path, self.__weights_path)
 
-        self.__net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
-        self.__net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        dnn.configure_net(self.__net, self.config)
 
+        # the output layers never change, so look them up once
+        self.__output_layers = self.__net.getUnconnectedOutLayersNames()
 
-    def _get_raw_detections(self, frame):
-        # create the input blob
-        blob = cv2.dnn.blobFromImage(frame, SCALE, (416, 416), (0, 0, 0), True, crop=False)
 
-        # set the input for the neural net
-        self.__net.setInput(blob)
+    def _get_raw_detections(self, frame):
+        with metrics.timer('preprocess', model='yolo'):
+            # create the input blob
+            blob = self._get_blob([frame], self.__input_size, dtype=np.float32, scale=SCALE, swap_rb=True)
 
-        layer_names = self.__net.getLayerNames()
-        output_layers = [layer_names[i[0] - 1] for i in self.__net.getUnconnectedOutLayers()]
+            # set the input for the neural net
+            self.__net.setInput(blob)
 
         # gather the predictions from the output layers
-        raw_detections = self.__net.forward(output_layers)
+        with metrics.timer('inference', model='yolo'):
+            raw_detections = self.__net.forward(self.__output_layers)
 
         return raw_detections
 
-    def _normalize_detections(self, raw_detections, frame):
-        normalized_detections = []
+    def _get_raw_detections_batch(self, frames):
+        with metrics.timer('preprocess', model='yolo'):
+            # create a single input blob for every frame
+            blob = self._get_blob(frames, self.__input_size, dtype=np.float32, scale=SCALE, swap_rb=True)
+
+            self.__net.setInput(blob)
+
+        with metrics.timer('inference', model='yolo'):
+            raw_detections = self.__net.forward(self.__output_layers)
 
+        # each output layer stacks the rows of every image in the batch, so split them back out per frame
+        split_layers = [np.split(output_layer, len(frames)) for output_layer in raw_detections]
+
+        return [[layer[i] for layer in split_layers] for i in range(len(frames))]
+
+    def _normalize_detections(self, raw_detections, frame):
         (H, W) = frame.shape[:2]
-        # initializations
-        class_ids = []
-        confs = []
-        boxes = []
-
-        # for each detection in each output layer,
-        # get the confidence, class_id, bounding box params,
-        
-        for output_layer in raw_detections:
-            for detection in output_layer:
-                scores = detection[5:]
-                class_id = np.argmax(scores)
-                conf = scores[class_id]
-
-                center_x = int(detection[0] * W)
-                center_y = int(detection[1] * H)
-                w = int(detection[2] * W)
-                h = int(detection[3] * H)
-                x = center_x - w / 2
-                y = center_y - h / 2
-
-                class_ids.append(class_id)
-                confs.append(float(conf))
-                boxes.append([x, y, w, h])
-
-        # apply non-maxima suppression
-        indices = cv2.dnn.NMSBoxes(boxes, confs, CONF_THRESH, NMS_THRESH)
-
-        for i in indices:
-            i = i[0]
-            x, y, w, h = boxes[i][:4]
-            class_id = class_ids[i]
-            confidence = confs[i]
-            box = [round(x), round(y), round(x + w), round(y + h)]
-            normalized_detections.append((class_id, confidence, box))
 
-        return normalized_detections
+        return decode_detections(raw_detections, W, H, self.get_class_mask(), self.get_min_confidence())
 
     def _get_normalized_detections(self, frame):
         # must be provided to the BaseDetector
         raw_detections = self._get_raw_detections(frame)
-        normalized_detections = self._normalize_detections(raw_detections, frame)
+
+        with metrics.timer('postprocess', model='yolo'):
+            normalized_detections = self._normalize_detections(raw_detections, frame)
 
         return normalized_detections
+
+    def _get_normalized_detections_batch(self, frames):
+        # may be provided to the BaseDetector
+        raw_detections_batch = self._get_raw_detections_batch(frames)
+
+        with metrics.timer('postprocess', model='yolo'):
+            return [
+                self._normalize_detections(raw_detections, frame)
+                for raw_detections, frame in zip(raw_detections_batch, frames)
+            ]
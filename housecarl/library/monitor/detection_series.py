@@ -16,6 +16,9 @@ class DetectionSeries:
         self.__best_frame = None
         self.__best_label = None
 
+        # ids of the distinct objects seen, when detections come from a tracker
+        self.__track_ids = set()
+
     def __inc_detections(self):
         self.__num_detections_in_series += 1
         self.__last_detection_at = time()
@@ -71,11 +74,24 @@ class DetectionSeries:
     def process_frame(self, frame, detections):
         self.__inc_detections()
 
-        for (label, confidence, box, color) in detections:
+        for detection in detections:
+            (label, confidence, box, color) = detection
+            track_id = getattr(detection, 'track_id', None)
+
+            if track_id is not None:
+                self.__track_ids.add(track_id)
+
             if not self.__best_confidence or confidence > self.__best_confidence:
                 self.__best_confidence = confidence
-                self.__best_frame = frame
+                # frames may be reused by the frame pool once the loop moves on, so keep a copy
+                self.__best_frame = frame.copy()
                 self.__best_label = label
 
+    def get_num_objects(self):
+        """
+        Number of distinct objects in the series, or None when detections aren't tracked.
+        """
+        return len(self.__track_ids) if self.__track_ids else None
+
     def get_best_frame_tuple(self):
         return (self.__best_frame, self.__best_label, self.__best_confidence)
@@ -1,11 +1,15 @@
 from time import time
 
-from housecarl.library.common import utility
+from housecarl.library.common import utility, metrics
 from housecarl.library.monitor.detection_series import DetectionSeries
 
 class Monitor:
-    def __init__(self, config, writer=None, pushover=None):
+    def __init__(self, config, writer=None, pushover=None, name=None):
+        """
+        name is an optional camera name, included in notifications when monitoring several cameras.
+        """
         self.config = config
+        self.name = name
         self.__writer = writer
         self.__pushover = pushover
         self.__last_detections = []
@@ -35,6 +39,14 @@ class Monitor:
         round_conf = utility.get_precision(confidence, 3)
 
         message = '{} detected with confidence {}'.format(capital_label, round_conf)
+
+        num_objects = self.__detection_series.get_num_objects()
+        if num_objects and num_objects > 1:
+            message = '{} ({} objects)'.format(message, num_objects)
+
+        if self.name:
+            message = '{}: {}'.format(self.name, message)
+
         self.__pushover.send_push_notification(message, frame)
 
     def __handle_series_activation(self):
@@ -66,12 +78,17 @@ class Monitor:
         return detections and not self.__detection_series
 
     def handle_detections(self, detections, frame):
+        with metrics.timer('monitor', camera=self.name or 'default'):
+            return self.__handle_detections(detections, frame)
+
+    def __handle_detections(self, detections, frame):
         # always add the frame
         if self.__writer is not None:
             self.__writer.update(frame)
             
-        # stale detections only occur when threaded
-        stale_detections = self.__last_detections is detections
+        # stale detections only occur when threaded or when frames are skipped
+        # boxes predicted by a tracker are also stale, as the detector didn't run
+        stale_detections = self.__last_detections is detections or getattr(detections, 'predicted', False)
 
         # update the cached detections so we can check again next loop
         if not stale_detections:
@@ -113,6 +130,15 @@ class Monitor:
 
             self.__terminate_detection_series()
 
+    def in_detection_series(self):
+        return self.__detection_series is not None
+
     def finish_recording(self):
         if self.__writer and self.__writer.is_recording():
-            self.__writer.finish()
+            (label, confidence) = (None, None)
+
+            # the strongest detection describes the event in the index
+            if self.__detection_series is not None:
+                (_, label, confidence) = self.__detection_series.get_best_frame_tuple()
+
+            self.__writer.finish(label=label, confidence=confidence)
@@ -2,7 +2,7 @@ import requests
 import numpy as np
 from threading import Thread
 
-from housecarl.library.common import utility
+from housecarl.library.common import utility, metrics
 from housecarl.library.camera.image import mat_to_bytes
 
 PUSHOVER_API_URL = "https://api.pushover.net/1/messages.json"
@@ -38,7 +38,8 @@ class Pushover:
             else:
                 utility.warn('Could not convert image to byes.')
 
-        r = requests.post(PUSHOVER_API_URL, **kwargs)
+        with metrics.timer('push'):
+            r = requests.post(PUSHOVER_API_URL, **kwargs)
 
         json_response = r.json()
 
@@ -5,12 +5,12 @@ from flask import jsonify, request
 from werkzeug.utils import secure_filename
 from flask import Flask, send_file, make_response, send_from_directory
 
-from housecarl.library.common import utility, constants
+from housecarl.library.common import utility, constants, metrics
+from housecarl.library.camera import event_index, video_codecs
+from housecarl.library.camera.event_index import EventIndex
 
 def is_video_file(video_name):
-    file_ending = video_name[-4:].lower()
-
-    return file_ending in ['.ogv', '.ogg']
+    return video_codecs.get_mime_type(video_name) is not None
 
 def should_serve_index(path):
     return '.' not in path or is_video_file(path)
@@ -49,6 +49,14 @@ class Server:
         def health():
             return jsonify('OK'), 200
 
+        # per stage latency histograms in the prometheus text format
+        @flask_app.route('/api/metrics', methods=['GET'])
+        def get_metrics():
+            resp = make_response(metrics.to_prometheus(), 200)
+            resp.headers['Content-Type'] = 'text/plain; version=0.0.4'
+
+            return resp
+
         # a route at /api/config that returns the full cli config
         @flask_app.route('/api/config', methods=['GET'])
         def get_config():
@@ -98,7 +106,8 @@ class Server:
                 return jsonify({'message': 'Video directory does not exists'}), 404
 
             video_array = []
-            dates = os.listdir(self.config.get('video_dir'))
+            # hidden directories, like the stream recorder's segments, aren't recordings
+            dates = [date for date in os.listdir(self.config.get('video_dir')) if not date.startswith('.')]
             dates.sort()
 
             for date in dates:
@@ -115,12 +124,31 @@ class Server:
 
             return jsonify(video_array)
 
+        # detection events, each with the videos and offsets to seek to for playback
+        @flask_app.route('/api/events', methods=['GET'])
+        def get_events():
+            # the index is only written when recording with config.writer.event_index
+            if not os.path.exists(os.path.join(self.config.get('video_dir'), event_index.INDEX_FILENAME)):
+                return jsonify([])
+
+            index = EventIndex(self.config.get('video_dir'))
+
+            try:
+                events = index.get_events(
+                    since=request.args.get('since', None, type=float),
+                    limit=request.args.get('limit', 500, type=int)
+                )
+            finally:
+                index.close()
+
+            return jsonify(events)
+
         @flask_app.route('/api/videos/<video_date>/<video_name>')
         def serve_video(video_date, video_name):
             safe_video_date = secure_filename(video_date)
             safe_video_name = secure_filename(video_name)
             video_path = os.path.join(self.config.get('video_dir'), safe_video_date, safe_video_name)
-            resp = make_response(send_file(video_path, 'video/ogg'))
+            resp = make_response(send_file(video_path, video_codecs.get_mime_type(safe_video_name)))
             resp.headers['Content-Disposition'] = 'inline'
             return resp
 